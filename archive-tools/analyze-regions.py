@@ -0,0 +1,208 @@
+"""
+Report what takes up space in the worlds of the NWSC server folders, and
+optionally prune the chunks players never spent time in.
+
+Region files are memory-mapped and only their 8 KiB header is read to find
+the chunks and their size. Unless `--quick` is given, each chunk is then
+decompressed to read its `InhabitedTime` (the ticks players spent nearby),
+without parsing the rest of its NBT. Region files are processed in parallel.
+
+    python analyze-regions.py                       # every NWSC folder
+    python analyze-regions.py "NWSC 3" --quick      # sizes only, from the headers
+    python analyze-regions.py "NWSC 3" --prune-below 1200          # what would be pruned
+    python analyze-regions.py "NWSC 3" --prune-below 1200 --prune  # prune it
+
+Pruned chunks are removed from the region files (and from the entity and POI
+files next to them), which are then rewritten without gaps. They generate
+again, from the world seed, if someone goes there. Pruning refuses to touch a
+world that is running; take a snapshot with archive-world.py first.
+
+The `mcutils` folder must be next to this script or in the folder above it.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+# Shared modules live in mcutils/, next to this script or in the repo root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcutils import anvil, server
+
+# InhabitedTime is in ticks, 20 per second.
+THRESHOLDS = [1, 20 * 60, 20 * 600, 20 * 3600]
+LABELS = ["never", "< 1 min", "< 10 min", "< 1 hour", "1 hour +", "unreadable"]
+UNREADABLE = len(LABELS) - 1
+
+# Other files holding data for the same chunks as a region file, in sibling folders.
+SIBLINGS = ["entities", "poi"]
+
+
+@dataclass
+class RegionReport:
+    path: str
+    size: int
+    chunks: int = 0
+    # Sectors holding chunks; the rest of the file after the header is unused.
+    used_sectors: int = 0
+    # Chunks and their bytes, for each InhabitedTime range in LABELS.
+    counts: list[int] = field(default_factory=lambda: [0] * len(LABELS))
+    sizes: list[int] = field(default_factory=lambda: [0] * len(LABELS))
+    pruned: list[int] = field(default_factory=list)
+    pruned_bytes: int = 0
+
+    @property
+    def unused(self) -> int:
+        return max(0, self.size - anvil.HEADER_SIZE - self.used_sectors * anvil.SECTOR)
+
+
+def chunk_inhabited_time(region: mmap.mmap, location: anvil.ChunkLocation) -> int | None:
+    try:
+        nbt = anvil.decompress_chunk(anvil.read_payload(region, location))
+        return anvil.inhabited_time(nbt) if nbt else None
+    except (OSError, EOFError, IndexError, ValueError, struct.error, zlib.error):
+        return None
+
+
+def analyze_region(path: str, inhabited: bool = True, prune_below: int = None) -> RegionReport:
+    """Read the header of a region file and, if `inhabited`, the InhabitedTime of each chunk."""
+    report = RegionReport(path, os.path.getsize(path))
+    if report.size < anvil.HEADER_SIZE:
+        return report
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as region:
+        for location in anvil.read_locations(region[: anvil.HEADER_SIZE]):
+            size = location.sectors * anvil.SECTOR
+            report.chunks += 1
+            report.used_sectors += location.sectors
+            ticks = chunk_inhabited_time(region, location) if inhabited else None
+            bucket = UNREADABLE if ticks is None else bisect_right(THRESHOLDS, ticks)
+            report.counts[bucket] += 1
+            report.sizes[bucket] += size
+            # Chunks that could not be read are never pruned.
+            if prune_below is not None and ticks is not None and ticks < prune_below:
+                report.pruned.append(location.index)
+                report.pruned_bytes += size
+    return report
+
+
+def remove_chunks(path: str, indices: set[int]):
+    """Rewrite a region file without the chunks at `indices`, or delete it if none are left."""
+    with open(path, "rb") as f:
+        data = f.read()
+    locations = anvil.read_locations(data[: anvil.HEADER_SIZE])
+    keep = [location for location in locations if location.index not in indices]
+    if len(keep) == len(locations):
+        return
+    if not keep:
+        os.remove(path)
+        return
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(anvil.compact_region(data, keep))
+    os.replace(f"{path}.tmp", path)
+
+
+def prune_region(path: str, prune_below: int) -> RegionReport:
+    """Remove the chunks inhabited for less than `prune_below` ticks from a region and its siblings."""
+    report = analyze_region(path, prune_below=prune_below)
+    if report.pruned:
+        indices = set(report.pruned)
+        region_folder, name = os.path.split(path)
+        dimension = os.path.dirname(region_folder)
+        for sibling in SIBLINGS:
+            if os.path.exists(sibling_path := os.path.join(dimension, sibling, name)):
+                remove_chunks(sibling_path, indices)
+        remove_chunks(path, indices)
+    return report
+
+
+def find_regions(folder: str) -> list[str]:
+    """The region files (not entities or POI) of every dimension under `folder`."""
+    paths = []
+    for dirpath, _, filenames in os.walk(folder):
+        if os.path.basename(dirpath) == "region":
+            paths += [os.path.join(dirpath, name) for name in filenames if anvil.region_coords(name)]
+    return sorted(paths)
+
+
+def megabytes(n: int) -> str:
+    return f"{n / 1024**2:,.1f} MB"
+
+
+def print_report(folder: str, reports: list[RegionReport], inhabited: bool, top: int):
+    size = sum(r.size for r in reports)
+    chunks = sum(r.chunks for r in reports)
+    unused = sum(r.unused for r in reports)
+    print(f"{folder}: {len(reports)} regions, {chunks:,} chunks, {megabytes(size)} ({megabytes(unused)} unused)")
+
+    dimensions = {}
+    for r in reports:
+        dimension = os.path.relpath(os.path.dirname(os.path.dirname(r.path)), folder)
+        dimensions.setdefault(dimension, []).append(r)
+    for dimension, group in sorted(dimensions.items()):
+        print(
+            f"  {dimension:<24} {len(group):>6} regions {sum(r.chunks for r in group):>10,} chunks "
+            f"{megabytes(sum(r.size for r in group)):>12}"
+        )
+
+    if inhabited and chunks:
+        print(f"\n  {'Time inhabited':<16} {'chunks':>10} {'share':>7} {'size':>12}")
+        for i, label in enumerate(LABELS):
+            count = sum(r.counts[i] for r in reports)
+            if count:
+                print(
+                    f"  {label:<16} {count:>10,} {count / chunks:>7.1%} "
+                    f"{megabytes(sum(r.sizes[i] for r in reports)):>12}"
+                )
+
+    if top:
+        print("\n  Largest region files:")
+        for r in sorted(reports, key=lambda r: r.size, reverse=True)[:top]:
+            print(
+                f"  {os.path.relpath(r.path, folder):<40} {megabytes(r.size):>10} "
+                f"{r.chunks:>5} chunks {megabytes(r.unused):>10} unused"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report the size of worlds, and prune unvisited chunks.")
+    parser.add_argument("folders", nargs="*", help="server folders (default: every NWSC folder)")
+    parser.add_argument("--quick", action="store_true", help="only read the region headers, not InhabitedTime")
+    parser.add_argument("--top", type=int, default=5, help="largest region files to list (default: 5)")
+    parser.add_argument("--workers", type=int, help="region files processed at once (default: number of cores)")
+    parser.add_argument("--prune-below", type=int, metavar="TICKS", help="select chunks inhabited for fewer ticks")
+    parser.add_argument("--prune", action="store_true", help="actually remove the selected chunks")
+    args = parser.parse_args()
+
+    if args.prune and args.prune_below is None:
+        parser.error("--prune needs --prune-below")
+    if args.quick and args.prune_below is not None:
+        parser.error("--prune-below needs InhabitedTime, which --quick does not read")
+
+    folders = args.folders or sorted(x for x in os.listdir() if os.path.isdir(x) and x.startswith("NWSC"))
+    with ProcessPoolExecutor(args.workers) as pool:
+        for folder in folders:
+            paths = find_regions(folder)
+            if args.prune:
+                if server.is_world_locked(folder):
+                    print(f"{folder} is running. Stop it before pruning.")
+                    continue
+                reports = list(pool.map(prune_region, paths, [args.prune_below] * len(paths), chunksize=4))
+            else:
+                inhabited = [not args.quick] * len(paths)
+                reports = list(pool.map(analyze_region, paths, inhabited, [args.prune_below] * len(paths), chunksize=4))
+
+            print_report(folder, reports, not args.quick, args.top)
+            if args.prune_below is not None:
+                pruned = sum(len(r.pruned) for r in reports)
+                action = "Pruned" if args.prune else "Would prune"
+                print(
+                    f"\n  {action} {pruned:,} chunks inhabited for less than {args.prune_below} ticks "
+                    f"({megabytes(sum(r.pruned_bytes for r in reports))})."
+                )
+            print()
@@ -0,0 +1,101 @@
+"""
+Archive the NWSC server folders into a deduplicated snapshot store.
+
+Each snapshot only stores what changed since the last one, down to single
+chunks within region files. If a world is running, saving is paused over RCON
+(`save-off`, then `save-all flush`) for the duration of the snapshot, so the
+files are consistent, and turned back on afterwards.
+
+    python archive-world.py snapshot               # every NWSC folder
+    python archive-world.py snapshot "NWSC 3"
+    python archive-world.py list
+    python archive-world.py restore "NWSC 3/20240131-020000" "NWSC 3 (restored)"
+
+The `mcutils` folder must be next to this script or in the folder above it.
+"""
+
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+
+# Shared modules live in mcutils/, next to this script or in the repo root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcutils import server
+from mcutils.chunkstore import ChunkStore
+from mcutils.rcon import RconClient, RconError
+
+RCON_PASSWORD = os.getenv("MC_RCON_PASSWORD")
+RCON_PORT = int(os.getenv("MC_RCON_PORT") or 25575)
+STORE = os.getenv("MC_ARCHIVE_STORE", "archive-store")
+
+
+@contextmanager
+def saves_paused(folder: str):
+    """Pause saving on the server running `folder`'s world, if it is running."""
+    if not server.is_world_locked(folder):
+        yield
+        return
+    if not RCON_PASSWORD:
+        print(f"{folder} is running, but MC_RCON_PASSWORD is not set. Archiving without pausing saves.")
+        yield
+        return
+
+    rcon = RconClient("localhost", RCON_PORT, RCON_PASSWORD, timeout=60)
+    try:
+        print("[CONSOLE] " + rcon.command("save-off"))
+    except (OSError, RconError) as e:
+        print(f"Could not pause saves ({e}). Archiving anyway.")
+        rcon.close()
+        yield
+        return
+
+    try:
+        # Writes every chunk to disk before returning.
+        print("[CONSOLE] " + rcon.command("save-all flush"))
+        yield
+    except BaseException:
+        # Turn saving back on, but report what went wrong in the first place.
+        try:
+            print("[CONSOLE] " + rcon.command("save-on", idempotent=True))
+        except (OSError, RconError) as e:
+            print(f"Could not turn saving back on ({e}). Run `save-on` on the server.")
+        raise
+    else:
+        print("[CONSOLE] " + rcon.command("save-on", idempotent=True))
+    finally:
+        rcon.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive the NWSC server folders.")
+    parser.add_argument("--store", default=STORE, help=f"where snapshots are kept (default: {STORE})")
+    parser.add_argument("--workers", type=int, help="files processed at once (default: number of cores)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("snapshot", help="take a snapshot of server folders")
+    command.add_argument("folders", nargs="*", help="server folders (default: every NWSC folder)")
+
+    command = commands.add_parser("list", help="list the snapshots")
+    command.add_argument("world", nargs="?")
+
+    command = commands.add_parser("restore", help="restore a snapshot into a new folder")
+    command.add_argument("snapshot", help='snapshot ID, like "NWSC 3/20240131-020000"')
+    command.add_argument("dest")
+
+    args = parser.parse_args()
+    store = ChunkStore(args.store, args.workers)
+
+    if args.command == "snapshot":
+        folders = args.folders or sorted(x for x in os.listdir() if os.path.isdir(x) and x.startswith("NWSC"))
+        for folder in folders:
+            print(f"Archiving {folder}...")
+            with saves_paused(folder):
+                snapshot_id, stats = store.snapshot(folder)
+            print(f"Saved {snapshot_id}: {stats}.")
+    elif args.command == "list":
+        for snapshot_id in store.list_snapshots(args.world):
+            print(snapshot_id)
+    elif args.command == "restore":
+        store.restore(args.snapshot, args.dest)
+        print(f"Restored {args.snapshot} to {args.dest}.")
@@ -0,0 +1,137 @@
+"""
+A stand-in for a Minecraft server, to try start-tour.py locally without Java.
+
+It behaves like the server as far as start-tour.py can tell: it reads its
+ports from server.properties, holds the world's session.lock, writes a new
+logs/latest.log with the "Done" line once started, answers RCON (`list`,
+`kick` and `stop`; other commands get an empty reply) and accepts connections on the server port. Each
+connection is greeted with the name of the folder, then echoed back, so it is
+easy to see which world a connection through the proxy ended up on.
+
+    MC_JAVA="python /path/to/dev/fake-server.py" MC_ROTATION=staged python start-tour.py
+
+Like the server, `--port` overrides the server port. Java arguments,
+`-jar server.jar` and `nogui` are ignored. Set
+`FAKE_STARTUP_SECONDS` to change how long it takes to start (default: 3).
+"""
+
+import fcntl
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Shared modules live in mcutils/, in the repo root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from mcutils.rcon import HEADER, SERVERDATA_AUTH, SERVERDATA_AUTH_FAILED, SERVERDATA_EXECCOMMAND
+from mcutils.server import read_properties
+
+# The auth response shares its type with SERVERDATA_EXECCOMMAND.
+SERVERDATA_RESPONSE_VALUE = 0
+
+STARTUP_SECONDS = float(os.getenv("FAKE_STARTUP_SECONDS", 3))
+
+
+class FakeServer:
+    def __init__(self, folder: str, port: int = None):
+        properties = read_properties(folder)
+        self.name = os.path.basename(os.path.abspath(folder))
+        self.port = port or int(properties.get("server-port") or 25565)
+        self.rcon_port = int(properties.get("rcon.port") or 25575)
+        self.password = properties.get("rcon.password", "")
+        self.world = os.path.join(folder, properties.get("level-name") or "world")
+        self.log_path = os.path.join(folder, "logs", "latest.log")
+        self.players = []
+        self.stopped = threading.Event()
+
+    def log(self, message: str):
+        self.log_file.write(f"[{datetime.now():%H:%M:%S}] [Server thread/INFO]: {message}\n")
+        self.log_file.flush()
+        print(message)
+
+    def run(self):
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        # Like the server, replace latest.log rather than append to it.
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.log_file = open(self.log_path, "w")
+        start = time.monotonic()
+        self.log(f"Starting minecraft server version fake ({self.name})")
+
+        os.makedirs(self.world, exist_ok=True)
+        lock = open(os.path.join(self.world, "session.lock"), "w")
+        fcntl.lockf(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        time.sleep(STARTUP_SECONDS)
+        game = socket.create_server(("", self.port))
+        rcon = socket.create_server(("", self.rcon_port))
+        threading.Thread(target=self.accept, args=(game, self.play), daemon=True).start()
+        threading.Thread(target=self.accept, args=(rcon, self.rcon), daemon=True).start()
+        self.log(f'Done ({time.monotonic() - start:.3f}s)! For help, type "help"')
+
+        self.stopped.wait()
+        self.log("Stopping the server")
+        game.close()
+        rcon.close()
+        for conn in list(self.players):
+            conn.shutdown(socket.SHUT_RDWR)
+        # Shutting down takes a moment, with the lock still held.
+        time.sleep(1)
+        lock.close()
+
+    def accept(self, listener: socket.socket, handle):
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+    def play(self, conn: socket.socket):
+        self.players.append(conn)
+        try:
+            conn.sendall(f"{self.name}\n".encode())
+            while data := conn.recv(65536):
+                conn.sendall(data)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+            if conn in self.players:
+                self.players.remove(conn)
+
+    def command(self, cmd: str) -> str:
+        if cmd == "list":
+            return f"There are {len(self.players)} of a max of 20 players online: "
+        if cmd.startswith("kick "):
+            kicked = len(self.players)
+            for conn in list(self.players):
+                conn.shutdown(socket.SHUT_RDWR)
+            return f"Kicked {kicked} players" if kicked else "No player was found"
+        if cmd == "stop":
+            threading.Timer(0.2, self.stopped.set).start()
+            return "Stopping the server"
+        return ""
+
+    def rcon(self, conn: socket.socket):
+        with conn:
+            while True:
+                header = conn.recv(HEADER.size, socket.MSG_WAITALL)
+                if len(header) < HEADER.size:
+                    return
+                length, request_id, packet_type = HEADER.unpack(header)
+                payload = conn.recv(length - (HEADER.size - 4), socket.MSG_WAITALL)[:-2].decode()
+                if packet_type == SERVERDATA_AUTH:
+                    response_id = request_id if payload == self.password else SERVERDATA_AUTH_FAILED
+                    response_type, response = SERVERDATA_EXECCOMMAND, ""
+                else:
+                    response_id, response_type, response = request_id, SERVERDATA_RESPONSE_VALUE, self.command(payload)
+                data = response.encode() + b"\0\0"
+                conn.sendall(HEADER.pack(HEADER.size - 4 + len(data), response_id, response_type) + data)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    FakeServer(".", int(args[args.index("--port") + 1]) if "--port" in args else None).run()
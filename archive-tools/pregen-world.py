@@ -0,0 +1,76 @@
+"""
+Pre-generate an area of the running world over RCON, so that players (and
+spectators, with `spectatorsGenerateChunks`) explore terrain that already
+exists instead of generating it live.
+
+Generation walks the area in a spiral from its center, pausing while players
+are online or ticks are slow, and slowing down as ticks approach the target.
+Uses the Chunky plugin if the server has it, and vanilla `forceload`
+otherwise. Progress is saved to a checkpoint, so running the same command
+again resumes where it stopped. See mcutils/pregen.py.
+
+    python pregen-world.py --radius 2000                       # around 0 0
+    python pregen-world.py --center 500 -300 --radius 1000 --dimension minecraft:the_nether
+    python pregen-world.py --box -1000 -1000 3000 1000 --backend forceload
+
+The `mcutils` folder must be next to this script or in the folder above it.
+"""
+
+import argparse
+import os
+import sys
+
+# Shared modules live in mcutils/, next to this script or in the repo root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcutils import pregen
+from mcutils.rcon import RconClient
+
+RCON_PASSWORD = os.environ["MC_RCON_PASSWORD"]
+RCON_PORT = int(os.environ["MC_RCON_PORT"])
+RCON_HOST = os.getenv("MC_HOST_ADDRESS", "localhost")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate an area of the running world.")
+    area = parser.add_mutually_exclusive_group(required=True)
+    area.add_argument("--radius", type=float, help="blocks around --center, as a square")
+    area.add_argument("--box", type=float, nargs=4, metavar=("X1", "Z1", "X2", "Z2"), help="corners, in blocks")
+    parser.add_argument("--center", type=float, nargs=2, default=(0, 0), metavar=("X", "Z"))
+    parser.add_argument("--dimension", default="minecraft:overworld")
+    parser.add_argument("--backend", choices=["auto", "chunky", "forceload"], default="auto")
+    parser.add_argument("--tile", type=int, default=8, help="chunks per side of a forceload batch (default: 8)")
+    parser.add_argument("--target-mspt", type=float, default=30.0, help="slow down above this (default: 30)")
+    parser.add_argument("--pause-mspt", type=float, default=45.0, help="pause above this (default: 45)")
+    parser.add_argument("--max-players", type=int, default=0, help="pause with more players online (default: 0)")
+    parser.add_argument("--checkpoint", default="pregen.json", help="progress file (default: pregen.json)")
+    args = parser.parse_args()
+
+    if args.tile * args.tile > pregen.MAX_FORCELOAD:
+        parser.error(f"--tile {args.tile} makes batches of more than {pregen.MAX_FORCELOAD} chunks")
+    if args.radius is not None:
+        area = pregen.Area.around(*args.center, args.radius)
+    else:
+        area = pregen.Area.from_blocks(*args.box)
+
+    rcon = RconClient(RCON_HOST, RCON_PORT, RCON_PASSWORD, timeout=30)
+    throttle = pregen.Throttle(args.target_mspt, args.pause_mspt, args.max_players)
+    backend = args.backend
+    if backend == "auto":
+        backend = "chunky" if pregen.ChunkyBackend.available(rcon) else "forceload"
+
+    job = {"backend": backend, "dimension": args.dimension, "area": vars(area), "tile": args.tile}
+    checkpoint = pregen.Checkpoint.load(args.checkpoint, job)
+    print(f"Generating {area.chunks:,} chunks in {args.dimension} with {backend}.")
+
+    try:
+        if backend == "chunky":
+            pregen.run_chunky(rcon, pregen.ChunkyBackend(rcon, args.dimension), area, throttle, checkpoint)
+        else:
+            backend = pregen.ForceloadBackend(rcon, args.dimension)
+            pregen.run_forceload(rcon, backend, area, args.tile, throttle, checkpoint)
+    except KeyboardInterrupt:
+        print(f"Stopped. Run the same command again to resume from {args.checkpoint}.")
+    else:
+        print("Done.")
+    finally:
+        rcon.close()
@@ -1,11 +1,15 @@
 """
 Set the gamemodes to prepare the server.
 
-To install required dependencies: `pip install mcrcon`.
+The `mcutils` folder must be next to this script or in the folder above it.
 """
 
 import os
-from mcrcon import MCRcon
+import sys
+
+# Shared modules live in mcutils/, next to this script or in the repo root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcutils.rcon import RconClient
 
 
 HOST = os.environ["MC_HOST_ADDRESS"]
@@ -13,10 +17,14 @@ RCON_PASSWORD = os.environ["MC_RCON_PASSWORD"]
 RCON_PORT = int(os.environ["MC_RCON_PORT"])
 
 
-def send_command(cmd):
-    with MCRcon(HOST, RCON_PASSWORD, RCON_PORT) as mc:
+rcon = RconClient(HOST, RCON_PORT, RCON_PASSWORD)
+
+
+def send_commands(cmds):
+    """Run commands in order over one connection, returning the console output of each."""
+    for cmd in cmds:
         print(cmd)
-        return "[CONSOLE] " + mc.command(cmd)
+    return ["[CONSOLE] " + msg for msg in rcon.batch(cmds)]
 
 
 if __name__ == "__main__":
@@ -28,21 +36,23 @@ if __name__ == "__main__":
         "spectatorsGenerateChunks": "true",
     }
 
-    for rule, value in rules.items():
-        send_command(f"gamerule {rule} {value}")
+    send_commands([f"gamerule {rule} {value}" for rule, value in rules.items()])
 
     print()
     input("Game rules set. Hit Enter to verify.")
     print()
 
     check_results = []
-    for rule, value in rules.items():
-        msg = send_command(f"gamerule {rule}")
+    msgs = send_commands([f"gamerule {rule}" for rule in rules])
+    for value, msg in zip(rules.values(), msgs):
         res = "PASS" if msg.endswith(value) else "FAIL"
         check_results.append(f"[{res}]    {msg}")
 
     print()
     print("\n".join(check_results))
     print()
+    print("RCON: {commands} commands, {avg_ms:.1f} ms average, {max_ms:.1f} ms max.".format(**rcon.stats()))
+    rcon.close()
+    print()
 
     input("All done.")
@@ -5,16 +5,36 @@ to each of their versions.
 
 See the .README/ folder for the expected structure for each folder.
 
-To install required dependencies: `pip install schedule mcrcon`.
+During the countdown to the switch, the next folder is checked and its files
+are read into the page cache (see mcutils/prewarm.py), so it starts warm.
+
+Set `MC_ROTATION=staged` to switch worlds without the downtime of a restart:
+the servers then run on standby ports behind proxies on the public port and
+on the RCON port (see mcutils/proxy.py). The next world is started while the
+current one is still up, and once it is ready, the proxies send new
+connections to it, and players are asked to reconnect before the old world
+stops.
+
+To install required dependencies: `pip install schedule`. The `mcutils`
+folder must be next to this script or in the folder above it.
 """
 
 import time
 import os
+import sys
 import json
+import threading
 import schedule
-from mcrcon import MCRcon
+
+# Shared modules live in mcutils/, next to this script or in the repo root.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcutils import prewarm, server
+from mcutils.metrics import registry
+from mcutils.proxy import TcpProxy
+from mcutils.rcon import RconClient, RconError
 
 LAUNCH_ARGS = "-Xms2G -Xmx10G -XX:+UseG1GC"
+JAVA = os.getenv("MC_JAVA", "java")
 
 START_TIME = time.time()
 
@@ -22,12 +42,46 @@ START_TIME = time.time()
 RCON_PASSWORD = os.environ["MC_RCON_PASSWORD"]
 RCON_PORT = int(os.environ["MC_RCON_PORT"])
 
+# How long to wait for the server to shut down, and then to start up again.
+STOP_TIMEOUT = int(os.getenv("MC_STOP_TIMEOUT", 300))
+STARTUP_TIMEOUT = int(os.getenv("MC_STARTUP_TIMEOUT", 600))
+# Serve Prometheus metrics on this port, if set.
+METRICS_PORT = int(os.getenv("MC_METRICS_PORT") or 0)
+# Read the next server's files into the page cache before switching to it,
+# at most this many megabytes per second. 0 turns it off.
+PREWARM_RATE = float(os.getenv("MC_PREWARM_RATE", 50))
+
+# "restart" stops the current world before starting the next one; "staged"
+# starts the next one first, and switches the public port over to it.
+ROTATION = os.getenv("MC_ROTATION", "restart")
+PUBLIC_PORT = int(os.getenv("MC_PUBLIC_PORT") or 25565)
+# In staged mode, the servers alternate between these (server port, RCON
+# port) pairs. The query port is the server port, so that both servers can run
+# at once. MC_RCON_PORT is forwarded to the running server, like the public
+# port, so other tools keep using it.
+SLOTS = [(PUBLIC_PORT + 1, RCON_PORT + 1), (PUBLIC_PORT + 2, RCON_PORT + 2)]
+# How long to wait for players to leave the old world before stopping it.
+DRAIN_TIMEOUT = int(os.getenv("MC_DRAIN_TIMEOUT", 30))
+
 YELLOW = "#FAA61A"
 RED = "#F04747"
 
 # Assumes server folder name starts with "NWSC"
 dirs = sorted(x for x in os.listdir() if os.path.isdir(x) and x.startswith("NWSC"))
 
+# Folders whose files were pre-read since they last started.
+prewarmed = set()
+startup_history = prewarm.StartupHistory()
+
+# In staged mode: the proxies on the public port and on the RCON port, and the
+# slot of the running server.
+proxy = None
+rcon_proxy = None
+active_slot = 0
+# In staged mode: the settings each starting server had in its
+# server.properties before they were replaced with the ports of its slot.
+replaced_properties = {}
+
 
 def select_version():
     """Display a menu to select the version to host first."""
@@ -70,14 +124,33 @@ def get_launch_args(folder):
         return LAUNCH_ARGS
 
 
-def start_server():
-    """Open a new terminal window and start the server."""
+def screen_session(slot=None):
+    return "mc_server" if slot is None else f"mc_server_{SLOTS[slot][0]}"
+
+
+def start_server(slot=None):
+    """
+    Open a new terminal window and start the server, on the ports of `slot` in staged mode.
+
+    The RCON and query ports can only be set in server.properties; call
+    `restore_properties` once the server has read them.
+    """
     folder = get_next_server()
     launch_args = get_launch_args(folder)
+    server_args = "nogui"
+    if slot is not None:
+        port, rcon_port = SLOTS[slot]
+        properties = server.read_properties(folder)
+        replaced_properties[folder] = {
+            "rcon.port": properties.get("rcon.port", "25575"),
+            "query.port": properties.get("query.port", "25565"),
+        }
+        server.write_properties(folder, {"rcon.port": rcon_port, "query.port": port})
+        server_args = f"--port {port} nogui"
     cmd = (
-        f"screen -S mc_server -dm bash -c"
+        f"screen -S {screen_session(slot)} -dm bash -c"
         f" \"cd '{os.path.abspath(folder)}';"
-        f' java {launch_args} -jar server.jar nogui"'
+        f' {JAVA} {launch_args} -jar server.jar {server_args}"'
     )
 
     print()
@@ -87,13 +160,34 @@ def start_server():
     print(f"Starting {folder}...")
     print(f"Next up: {dirs[0]}")
     os.system(cmd)
+    return folder
+
+
+def restore_properties(folder):
+    """Put back the settings `start_server` replaced, so the folder can also be started on its own."""
+    if folder in replaced_properties:
+        server.write_properties(folder, replaced_properties.pop(folder))
+
+
+def start_staged(slot):
+    """Start the next server on `slot`, and wait until it is ready. Returns the folder and the startup time."""
+    port = SLOTS[slot][0]
+    log = os.path.join(dirs[0], "logs", "latest.log")
+    lines = server.follow_log(log, server.get_identity(log), STARTUP_TIMEOUT)
+
+    folder = start_server(slot)
+    print(f"Waiting for {folder} to be ready on port {port}.")
+    startup = server.wait_until_ready(lines, port)
+    restore_properties(folder)
+    return folder, startup
+
+
+# In staged mode, this talks to the running server directly rather than through the RCON proxy.
+rcon = RconClient("localhost", SLOTS[active_slot][1] if ROTATION == "staged" else RCON_PORT, RCON_PASSWORD, timeout=10)
 
 
 def send_command(cmd):
-    with MCRcon(
-        host="localhost", password=RCON_PASSWORD, port=RCON_PORT, timeout=10
-    ) as mc:
-        print("[CONSOLE] " + mc.command(cmd))
+    print("[CONSOLE] " + rcon.command(cmd))
 
 
 def warn_server(color, time):
@@ -109,26 +203,140 @@ def warn_server(color, time):
     print(f"Sent a warning that the server will restart in {time}.")
 
 
+def check_next_server():
+    """Warn about anything that would keep the next server from starting, while there is time to fix it."""
+    if problems := prewarm.check_folder(dirs[0]):
+        print(f"{dirs[0]} may not start:")
+        for problem in problems:
+            print(f"  - {problem}")
+    else:
+        print(f"{dirs[0]} is ready to start.")
+
+
+def prewarm_next_server():
+    """Read the next server's jars and spawn region files into the page cache, in the background."""
+
+    def run(folder):
+        files, size, elapsed = prewarm.prewarm(folder, PREWARM_RATE)
+        prewarmed.add(folder)
+        print(f"Pre-read {files} files of {folder} ({size / 1024**2:.0f} MB) in {elapsed:.1f} seconds.")
+
+    threading.Thread(target=run, args=(dirs[0],), daemon=True).start()
+
+
+def report_startup(lines, stopped_at, folder):
+    """Report the downtime, and compare the startup time with the last one of the other kind."""
+    warm = folder in prewarmed
+    prewarmed.discard(folder)
+    if (seconds := server.report_startup(lines, stopped_at)) is not None:
+        print(startup_history.record(folder, seconds, warm))
+
+
 def stop_and_start_server():
-    send_command("kick @a The server is restarting. Service will resume momentarily.")
-    send_command("stop")
-    print("Sent a request to stop the server. Will relaunch in 60 seconds.")
-    time.sleep(60)
+    stopped_at = time.monotonic()
+    for msg in rcon.batch(
+        ["kick @a The server is restarting. Service will resume momentarily.", "stop"]
+    ):
+        print("[CONSOLE] " + msg)
+    # The server closes the connection as it stops.
+    rcon.close()
+    print("RCON: {commands} commands, {avg_ms:.1f} ms average, {max_ms:.1f} ms max.".format(**rcon.stats()))
+    print("Sent a request to stop the server. Waiting for it to shut down.")
+
+    # The running server is the one that was last cycled to the back.
+    elapsed = server.wait_until_stopped(dirs[-1], timeout=STOP_TIMEOUT)
+    if elapsed is None:
+        print(f"The server is still running after {STOP_TIMEOUT} seconds. Not relaunching.")
+        return
+    print(f"The server shut down in {elapsed:.1f} seconds. Relaunching.")
+
+    log = os.path.join(dirs[0], "logs", "latest.log")
+    lines = server.follow_log(log, server.get_identity(log), STARTUP_TIMEOUT)
+    threading.Thread(target=report_startup, args=(lines, stopped_at, dirs[0]), daemon=True).start()
     start_server()
 
 
+def stage_and_switch():
+    """Start the next world next to the running one, then move the public and RCON ports over to it."""
+    global active_slot
+
+    old_folder, old_slot = dirs[-1], active_slot
+    old_backend = ("127.0.0.1", SLOTS[old_slot][0])
+    slot = 1 - active_slot
+    port, rcon_port = SLOTS[slot]
+    warm = dirs[0] in prewarmed
+    prewarmed.discard(dirs[0])
+
+    folder, startup = start_staged(slot)
+    if startup is None:
+        print(f"{folder} did not start within {STARTUP_TIMEOUT} seconds. Staying on {old_folder}.")
+        stop_standby(slot)
+        # Put it back in front, to try again at the next rotation.
+        dirs.insert(0, dirs.pop())
+        return
+    print(startup_history.record(folder, startup, warm))
+
+    proxy.switch(("127.0.0.1", port))
+    rcon_proxy.switch(("127.0.0.1", rcon_port))
+    print(f"New connections now go to {folder}.")
+    try:
+        send_command("kick @a The world has changed! Reconnect to join the next one.")
+        # Kicked players reconnect through the proxy; stop once their old connections are closed.
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while (remaining := proxy.open_connections(old_backend)) and time.monotonic() < deadline:
+            time.sleep(0.5)
+        if remaining:
+            print(f"{remaining} connections to {old_folder} are still open after {DRAIN_TIMEOUT} seconds.")
+        send_command("stop")
+    except (OSError, RconError) as e:
+        print(f"Could not stop {old_folder}: {e}")
+    rcon.close()
+    rcon.port = rcon_port
+    active_slot = slot
+
+    elapsed = server.wait_until_stopped(
+        old_folder, session=screen_session(old_slot), timeout=STOP_TIMEOUT, port=old_backend[1]
+    )
+    if elapsed is None:
+        print(f"{old_folder} is still running after {STOP_TIMEOUT} seconds.")
+    else:
+        print(f"{old_folder} shut down in {elapsed:.1f} seconds.")
+
+
+def stop_standby(slot):
+    """Stop a server that was started on a standby slot but never became ready."""
+    try:
+        with RconClient("localhost", SLOTS[slot][1], RCON_PASSWORD, timeout=10) as standby:
+            print("[CONSOLE] " + standby.command("stop"))
+    except (OSError, RconError):
+        # It never got far enough to listen for RCON.
+        os.system(f"screen -S {screen_session(slot)} -X quit")
+
+
 schedule.every().day.at("01:00").do(warn_server, YELLOW, "an hour")
+schedule.every().day.at("01:00").do(check_next_server)
 schedule.every().day.at("01:30").do(warn_server, YELLOW, "30 minutes")
 schedule.every().day.at("01:45").do(warn_server, RED, "15 minutes")
+if PREWARM_RATE:
+    schedule.every().day.at("01:50").do(prewarm_next_server)
 schedule.every().day.at("01:55").do(warn_server, RED, "5 minutes")
 schedule.every().day.at("01:59").do(warn_server, RED, "60 seconds")
 schedule.every().day.at("02:00").do(warn_server, RED, "10 seconds")
-schedule.every().day.at("02:01").do(stop_and_start_server)
+schedule.every().day.at("02:01").do(stage_and_switch if ROTATION == "staged" else stop_and_start_server)
 
 
 if __name__ == "__main__":
     select_version()
-    start_server()
+    if METRICS_PORT:
+        registry.serve(METRICS_PORT)
+    if ROTATION == "staged":
+        proxy = TcpProxy(PUBLIC_PORT, ("127.0.0.1", SLOTS[active_slot][0])).start()
+        rcon_proxy = TcpProxy(RCON_PORT, ("127.0.0.1", SLOTS[active_slot][1])).start()
+        folder, startup = start_staged(active_slot)
+        if startup is None:
+            print(f"{folder} did not start within {STARTUP_TIMEOUT} seconds.")
+    else:
+        start_server()
     while True:
         schedule.run_pending()
         time.sleep(5)
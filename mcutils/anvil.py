@@ -0,0 +1,189 @@
+"""
+Read Minecraft region files (Anvil `.mca`, and the older McRegion `.mcr`).
+
+A region file holds up to 32x32 chunks. It starts with an 8 KiB header: 1024
+big-endian location entries (a 3-byte offset and a 1-byte length, both in 4
+KiB sectors), then 1024 timestamps of when each chunk was last saved. Each
+chunk's data starts at its offset with a 4-byte length, a 1-byte compression
+type and the compressed NBT. See https://minecraft.wiki/w/Region_file_format.
+
+Only as much of the NBT is read as the helpers below need; there is no full
+NBT parser here.
+"""
+
+import gzip
+import mmap
+import re
+import struct
+import zlib
+from dataclasses import dataclass
+
+SECTOR = 4096
+HEADER_SIZE = 2 * SECTOR
+CHUNKS = 1024
+
+REGION_NAME = re.compile(r"r\.(-?\d+)\.(-?\d+)\.mc[ar]$")
+
+
+@dataclass(slots=True)
+class ChunkLocation:
+    index: int
+    # In sectors from the start of the file.
+    offset: int
+    sectors: int
+    timestamp: int
+
+    @property
+    def x(self) -> int:
+        """Position of the chunk within its region."""
+        return self.index % 32
+
+    @property
+    def z(self) -> int:
+        return self.index // 32
+
+
+def is_region_file(name: str) -> bool:
+    return name.endswith((".mca", ".mcr"))
+
+
+def region_coords(name: str) -> tuple[int, int] | None:
+    """Region x and z from a file name like "r.-1.2.mca"."""
+    if match := REGION_NAME.search(name):
+        return int(match[1]), int(match[2])
+    return None
+
+
+def read_locations(header: bytes) -> list[ChunkLocation]:
+    """The chunks present in a region file, from its header."""
+    if len(header) < HEADER_SIZE:
+        return []
+    locations = struct.unpack(f">{CHUNKS}I", header[:SECTOR])
+    timestamps = struct.unpack(f">{CHUNKS}I", header[SECTOR:HEADER_SIZE])
+    return [
+        ChunkLocation(i, location >> 8, location & 0xFF, timestamps[i])
+        for i, location in enumerate(locations)
+        if location
+    ]
+
+
+def read_payload(region: bytes | mmap.mmap, location: ChunkLocation) -> bytes:
+    """
+    Slice the data of one chunk out of a region file read into memory (or
+    mapped): its length, compression type and compressed NBT.
+
+    If the length is not plausible (a corrupted chunk), every sector the chunk
+    occupies is returned instead, so nothing is lost.
+    """
+    start = location.offset * SECTOR
+    span = region[start : start + location.sectors * SECTOR]
+    if len(span) < 5:
+        return span
+    (length,) = struct.unpack(">I", span[:4])
+    if 0 < length <= len(span) - 4:
+        return span[: 4 + length]
+    return span
+
+
+def decompress_chunk(payload: bytes) -> bytes | None:
+    """
+    Decompress the NBT of a chunk from its data (as returned by `read_payload`).
+
+    Returns `None` for compression that is not supported (LZ4, or chunks
+    stored in a separate .mcc file).
+    """
+    if len(payload) < 5:
+        return None
+    compression = payload[4]
+    data = payload[5:]
+    if compression == 1:
+        return gzip.decompress(data)
+    if compression == 2:
+        return zlib.decompress(data)
+    if compression == 3:
+        return data
+    return None
+
+
+# Sizes of the NBT tags with a fixed-size payload, by tag type.
+_FIXED_SIZE = {1: 1, 2: 2, 3: 4, 4: 8, 5: 4, 6: 8}
+
+
+def _skip_tag(nbt: bytes, pos: int, tag: int) -> int:
+    """Return the position just past the payload of a tag starting at `pos`."""
+    if tag in _FIXED_SIZE:
+        return pos + _FIXED_SIZE[tag]
+    if tag == 7:  # byte array
+        return pos + 4 + struct.unpack_from(">i", nbt, pos)[0]
+    if tag == 8:  # string
+        return pos + 2 + struct.unpack_from(">H", nbt, pos)[0]
+    if tag == 9:  # list
+        item = nbt[pos]
+        (count,) = struct.unpack_from(">i", nbt, pos + 1)
+        pos += 5
+        if item in _FIXED_SIZE:
+            return pos + count * _FIXED_SIZE[item]
+        for _ in range(count):
+            pos = _skip_tag(nbt, pos, item)
+        return pos
+    if tag == 10:  # compound
+        while (child := nbt[pos]) != 0:
+            pos += 3 + struct.unpack_from(">H", nbt, pos + 1)[0]
+            pos = _skip_tag(nbt, pos, child)
+        return pos + 1
+    if tag == 11:  # int array
+        return pos + 4 + 4 * struct.unpack_from(">i", nbt, pos)[0]
+    if tag == 12:  # long array
+        return pos + 4 + 8 * struct.unpack_from(">i", nbt, pos)[0]
+    raise ValueError(f"Unknown NBT tag type {tag}.")
+
+
+# struct formats of the integer NBT tags.
+_NUMBER_FORMATS = {1: ">b", 2: ">h", 3: ">i", 4: ">q"}
+
+
+def _find_tag(nbt: bytes, pos: int, name: bytes, tag: int, containers: tuple[bytes, ...]) -> int | None:
+    while (child := nbt[pos]) != 0:
+        (length,) = struct.unpack_from(">H", nbt, pos + 1)
+        child_name = nbt[pos + 3 : pos + 3 + length]
+        pos += 3 + length
+        if child == tag and child_name == name:
+            return struct.unpack_from(_NUMBER_FORMATS[tag], nbt, pos)[0]
+        if child == 10 and child_name in containers:
+            return _find_tag(nbt, pos, name, tag, containers)
+        pos = _skip_tag(nbt, pos, child)
+    return None
+
+
+def find_number(nbt: bytes, name: str, tag: int, containers: tuple[str, ...] = ()) -> int | None:
+    """
+    Read an integer tag from uncompressed NBT. It is looked for in the root
+    compound, and in the first compound in it whose name is in `containers`.
+
+    Only the tags before it are walked, and their contents are skipped over
+    rather than parsed.
+    """
+    if not nbt or nbt[0] != 10:
+        return None
+    (length,) = struct.unpack_from(">H", nbt, 1)
+    return _find_tag(nbt, 3 + length, name.encode(), tag, tuple(c.encode() for c in containers))
+
+
+def inhabited_time(nbt: bytes) -> int | None:
+    """Read how many ticks players have spent in a chunk from its NBT."""
+    # Before 1.18, everything is in a "Level" compound.
+    return find_number(nbt, "InhabitedTime", 4, ("Level",))
+
+
+def compact_region(region: bytes | mmap.mmap, keep: list[ChunkLocation]) -> bytes:
+    """Build a region file holding only the chunks in `keep`, packed one after another."""
+    header = bytearray(HEADER_SIZE)
+    body = bytearray()
+    sector = HEADER_SIZE // SECTOR
+    for location in sorted(keep, key=lambda location: location.offset):
+        start = location.offset * SECTOR
+        body += region[start : start + location.sectors * SECTOR]
+        struct.pack_into(">I", header, 4 * location.index, sector << 8 | location.sectors)
+        struct.pack_into(">I", header, SECTOR + 4 * location.index, location.timestamp)
+        sector += location.sectors
+    return bytes(header + body)
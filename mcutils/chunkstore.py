@@ -0,0 +1,234 @@
+"""
+A content-addressed, deduplicated store of world snapshots.
+
+Every piece of data is stored once, as an object named by its SHA-256 hash.
+Region files are split into their header and the data of each chunk, so a
+chunk that did not change is not stored again even if the region file around
+it did (or it moved within the file). Other files are stored whole.
+
+A snapshot is a manifest listing each file with the objects it is made of.
+Files whose size and modification time match the previous snapshot of the
+same world are not read at all, so a snapshot only costs I/O for what changed.
+Files are read, hashed and compressed in parallel.
+
+    store/
+    ├─ objects/ab/cdef…         # one byte of format, then the (compressed) data
+    └─ snapshots/<world>/<YYYYMMDD-HHMMSS>.json.gz
+
+Restored region files hold the same header and chunks at the same offsets as
+the originals; unused sectors are zeroed.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+
+from mcutils import anvil
+
+# First byte of every object: how the rest of it is stored.
+RAW = b"\0"
+ZLIB = b"\1"
+# Only keep the compressed copy if it is at least this much smaller.
+MIN_SAVING = 0.1
+# Chunk compression type for uncompressed chunks; other chunks are already compressed.
+UNCOMPRESSED_CHUNK = 3
+
+# Never archived: the server holds a lock on it while running.
+EXCLUDE = {"session.lock"}
+
+
+@dataclass
+class SnapshotStats:
+    files: int = 0
+    changed: int = 0
+    bytes_read: int = 0
+    objects_written: int = 0
+    bytes_written: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (
+            f"{self.files} files, {self.changed} changed ({self.bytes_read / 1024**2:.1f} MB read), "
+            f"{self.objects_written} new objects ({self.bytes_written / 1024**2:.1f} MB written) "
+            f"in {self.seconds:.1f} s"
+        )
+
+
+def fsync_dir(path: str):
+    """Make the files created or renamed in `path` survive a crash."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ChunkStore:
+    def __init__(self, root: str, workers: int = None):
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.snapshots = os.path.join(root, "snapshots")
+        self.workers = workers or os.cpu_count() or 1
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.snapshots, exist_ok=True)
+        # Folders with new objects whose names are not on disk yet.
+        self.written_dirs = set()
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def put(self, data: bytes, compress: bool = True) -> tuple[str, int]:
+        """Store `data` unless it already is. Returns its hash and the number of bytes written."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+
+        blob = RAW + data
+        if compress:
+            compressed = zlib.compress(data, 6)
+            if len(compressed) < len(data) * (1 - MIN_SAVING):
+                blob = ZLIB + compressed
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Another thread may be writing the same object; each writes its own
+        # temporary file, and the rename makes either one appear whole.
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self.written_dirs.update((os.path.dirname(path), self.objects))
+        return digest, len(blob)
+
+    def get(self, digest: str) -> bytes:
+        """Read an object back, checking that it was not corrupted."""
+        with open(self._object_path(digest), "rb") as f:
+            blob = f.read()
+        data = zlib.decompress(blob[1:]) if blob[:1] == ZLIB else blob[1:]
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Object {digest} is corrupted.")
+        return data
+
+    def list_snapshots(self, world: str = None) -> list[str]:
+        """Snapshot IDs ("<world>/<timestamp>"), oldest first for each world."""
+        worlds = [world] if world else sorted(os.listdir(self.snapshots))
+        ids = []
+        for w in worlds:
+            try:
+                names = sorted(os.listdir(os.path.join(self.snapshots, w)))
+            except FileNotFoundError:
+                continue
+            ids += [f"{w}/{name.removesuffix('.json.gz')}" for name in names if name.endswith(".json.gz")]
+        return ids
+
+    def load(self, snapshot_id: str) -> dict:
+        with gzip.open(os.path.join(self.snapshots, f"{snapshot_id}.json.gz"), "rt") as f:
+            return json.load(f)
+
+    def snapshot(self, folder: str, world: str = None) -> tuple[str, SnapshotStats]:
+        """Store a snapshot of `folder`. Returns its ID and what it cost."""
+        start = time.monotonic()
+        world = world or os.path.basename(os.path.abspath(folder))
+        previous_ids = self.list_snapshots(world)
+        previous = self.load(previous_ids[-1])["files"] if previous_ids else {}
+
+        paths = []
+        for dirpath, _, filenames in os.walk(folder):
+            for name in filenames:
+                if name not in EXCLUDE:
+                    paths.append(os.path.relpath(os.path.join(dirpath, name), folder))
+
+        stats = SnapshotStats(files=len(paths))
+        files = {}
+        with ThreadPoolExecutor(self.workers) as pool:
+            results = pool.map(lambda rel: self._store_file(folder, rel, previous.get(rel)), paths)
+            for rel, (entry, read, objects, written) in zip(paths, results):
+                files[rel] = entry
+                stats.changed += read > 0
+                stats.bytes_read += read
+                stats.objects_written += objects
+                stats.bytes_written += written
+
+        # Only refer to the objects once they are safely on disk. Each object
+        # was synced as it was written; this syncs their names.
+        for path in self.written_dirs:
+            fsync_dir(path)
+        self.written_dirs.clear()
+        os.makedirs(os.path.join(self.snapshots, world), exist_ok=True)
+        name = base = datetime.now().strftime("%Y%m%d-%H%M%S")
+        n = 1
+        while os.path.exists(path := os.path.join(self.snapshots, world, f"{name}.json.gz")):
+            n += 1
+            name = f"{base}-{n}"
+        with open(f"{path}.tmp", "wb") as raw:
+            with gzip.open(raw, "wt") as f:
+                json.dump({"world": world, "created": datetime.now().isoformat(), "files": files}, f)
+            os.fsync(raw.fileno())
+        os.replace(f"{path}.tmp", path)
+        fsync_dir(os.path.dirname(path))
+
+        stats.seconds = time.monotonic() - start
+        return f"{world}/{name}", stats
+
+    def _store_file(self, folder: str, rel: str, previous: dict | None) -> tuple[dict, int, int, int]:
+        """Store one file. Returns its manifest entry, the bytes read, and the objects and bytes written."""
+        path = os.path.join(folder, rel)
+        stat = os.stat(path)
+        if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+            return previous, 0, 0, 0
+
+        with open(path, "rb") as f:
+            data = f.read()
+        entry = {"size": len(data), "mtime_ns": stat.st_mtime_ns}
+        objects = written = 0
+
+        def put(blob: bytes, compress: bool = True) -> str:
+            nonlocal objects, written
+            digest, n = self.put(blob, compress)
+            objects += n > 0
+            written += n
+            return digest
+
+        if anvil.is_region_file(rel) and len(data) >= anvil.HEADER_SIZE:
+            header = data[: anvil.HEADER_SIZE]
+            entry["header"] = put(header)
+            entry["chunks"] = []
+            for location in anvil.read_locations(header):
+                payload = anvil.read_payload(data, location)
+                is_compressed = len(payload) > 4 and payload[4] != UNCOMPRESSED_CHUNK
+                entry["chunks"].append([location.offset, put(payload, compress=not is_compressed)])
+        else:
+            entry["hash"] = put(data)
+        return entry, len(data), objects, written
+
+    def restore(self, snapshot_id: str, dest: str):
+        """Write out every file of a snapshot into `dest`, which must be empty or not exist."""
+        if os.path.exists(dest) and os.listdir(dest):
+            raise FileExistsError(f"{dest} is not empty.")
+        files = self.load(snapshot_id)["files"]
+        with ThreadPoolExecutor(self.workers) as pool:
+            # Consume the results so that errors are raised here.
+            list(pool.map(lambda item: self._restore_file(dest, *item), files.items()))
+
+    def _restore_file(self, dest: str, rel: str, entry: dict):
+        path = os.path.join(dest, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            if "chunks" in entry:
+                f.write(self.get(entry["header"]))
+                for offset, digest in entry["chunks"]:
+                    f.seek(offset * anvil.SECTOR)
+                    f.write(self.get(digest))
+                f.truncate(entry["size"])
+            else:
+                f.write(self.get(entry["hash"]))
+        os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
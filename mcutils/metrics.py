@@ -0,0 +1,155 @@
+"""
+A lightweight, in-process metrics registry with a Prometheus endpoint.
+
+Metrics are plain counters, gauges and histograms held in memory; recording
+one is a dictionary lookup (done once, when the metric is created) and an
+addition. Call `serve` to expose everything in the Prometheus text format at
+http://host:port/metrics.
+
+    LINES = registry.counter("lines_scanned_total", "Log lines scanned.")
+    LINES.inc(100)
+
+    with registry.histogram("poll_seconds", "Time per poll.").time():
+        ...
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, labels: dict):
+        self.labels = labels
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self, name: str):
+        yield name, self.labels, self.value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, labels: dict, buckets=DEFAULT_BUCKETS):
+        self.labels = labels
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe how long the `with` block takes, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name: str):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), counts):
+            cumulative += count
+            yield f"{name}_bucket", {**self.labels, "le": bound}, cumulative
+        yield f"{name}_sum", self.labels, total
+        yield f"{name}_count", self.labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        # name -> (kind, help, {label values: metric})
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, labels: dict, **kwargs):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            kind, _, children = self.metrics.setdefault(name, (cls.kind, help, {}))
+            if kind != cls.kind:
+                raise ValueError(f"{name} is already registered as a {kind}.")
+            if key not in children:
+                children[key] = cls(labels, **kwargs)
+            return children[key]
+
+    def counter(self, name: str, help: str, **labels) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, **labels) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            metrics = [
+                (name, kind, help, list(children.values()))
+                for name, (kind, help, children) in self.metrics.items()
+            ]
+        for name, kind, help, children in metrics:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for child in children:
+                for sample, labels, value in child.samples(name):
+                    lines.append(f"{sample}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve the metrics over HTTP from a background thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Serving metrics at http://{host}:{port}/metrics")
+        return server
+
+
+# The registry shared by everything in the process.
+registry = Registry()
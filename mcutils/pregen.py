@@ -0,0 +1,333 @@
+"""
+Pre-generate the chunks of an area over RCON, without lagging the server.
+
+The area is walked in a spiral from its center, one tile of chunks at a time.
+Between tiles, the server's load is sampled: while players are online or ticks
+are too slow, generation pauses, and while ticks are slower than the target,
+the wait between tiles grows (and shrinks again once they are fast).
+
+Chunks are generated with one of two backends:
+
+* `ForceloadBackend` uses the vanilla `forceload` command: each tile is
+  force-loaded, which generates it, then released once `execute if loaded`
+  confirms every chunk is there.
+* `ChunkyBackend` drives the Chunky plugin, which walks the area itself; it is
+  only paused and continued as the load requires.
+
+Progress is saved to a checkpoint after every tile, so an interrupted run
+picks up where it left off.
+"""
+
+import json
+import os
+import re
+import time
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass, field
+
+from mcutils import ticks
+from mcutils.rcon import RconClient
+
+# `forceload` refuses areas of more than 256 chunks.
+MAX_FORCELOAD = 256
+
+# Responses to commands the server does not have, or did not accept.
+COMMAND_ERRORS = ("Unknown or incomplete command", "Unknown command", "Incorrect argument", "Too many chunks")
+# Chunks listed by `forceload query`, like "[12, -3]".
+FORCED_CHUNK = re.compile(r"\[(-?\d+), (-?\d+)\]")
+
+
+class PregenError(Exception):
+    """Raised when the server refuses to generate chunks."""
+
+
+def spiral(rings: int) -> Iterator[tuple[int, int]]:
+    """Offsets from (0, 0), ring by ring, going around each ring once."""
+    yield 0, 0
+    for r in range(1, rings + 1):
+        x, z = r, -r
+        for dx, dz in ((0, 1), (-1, 0), (0, -1), (1, 0)):
+            for _ in range(2 * r):
+                yield x, z
+                x += dx
+                z += dz
+
+
+@dataclass
+class Area:
+    """A rectangle of chunks, corners included."""
+
+    x1: int
+    z1: int
+    x2: int
+    z2: int
+
+    @classmethod
+    def from_blocks(cls, x1: float, z1: float, x2: float, z2: float) -> "Area":
+        x1, x2 = sorted((int(x1) // 16, int(x2) // 16))
+        z1, z2 = sorted((int(z1) // 16, int(z2) // 16))
+        return cls(x1, z1, x2, z2)
+
+    @classmethod
+    def around(cls, x: float, z: float, radius: float) -> "Area":
+        """The square within `radius` blocks of (x, z)."""
+        return cls.from_blocks(x - radius, z - radius, x + radius, z + radius)
+
+    @property
+    def chunks(self) -> int:
+        return (self.x2 - self.x1 + 1) * (self.z2 - self.z1 + 1)
+
+    def tiles(self, size: int) -> list["Area"]:
+        """Split into tiles of at most `size` x `size` chunks, in a spiral from the center."""
+        cx = (self.x1 + self.x2) // 2 - size // 2
+        cz = (self.z1 + self.z2) // 2 - size // 2
+        rings = max(cx - self.x1, self.x2 - cx, cz - self.z1, self.z2 - cz) // size + 1
+        tiles = []
+        for i, j in spiral(rings):
+            x1, z1 = cx + i * size, cz + j * size
+            tile = Area(max(x1, self.x1), max(z1, self.z1), min(x1 + size - 1, self.x2), min(z1 + size - 1, self.z2))
+            if tile.x1 <= tile.x2 and tile.z1 <= tile.z2:
+                tiles.append(tile)
+        return tiles
+
+
+@dataclass
+class Throttle:
+    """Decide how long to wait before the next tile, from the server's load."""
+
+    # Slow down above this many milliseconds per tick, and pause above `pause_mspt`.
+    target_mspt: float = 30.0
+    pause_mspt: float = 45.0
+    # Pause while more players than this are online.
+    max_players: int = 0
+    min_delay: float = 0.0
+    max_delay: float = 60.0
+
+    delay: float = field(default=1.0, init=False)
+
+    def decide(self, players: int, mspt: float | None) -> float | None:
+        """Seconds to wait before the next tile, or `None` to pause."""
+        if players > self.max_players or (mspt is not None and mspt >= self.pause_mspt):
+            return None
+        if mspt is not None and mspt > self.target_mspt:
+            self.delay = min(self.max_delay, max(2 * self.delay, 1.0))
+        elif self.delay > 0.25:
+            self.delay /= 2
+        else:
+            self.delay = self.min_delay
+        return max(self.delay, self.min_delay)
+
+
+@dataclass
+class Checkpoint:
+    """How far a run got, saved as JSON after every tile."""
+
+    path: str
+    # What is being generated; a checkpoint for anything else is ignored.
+    job: dict
+    done: int = 0
+    started: bool = False
+
+    @classmethod
+    def load(cls, path: str, job: dict) -> "Checkpoint":
+        try:
+            with open(path, "r") as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return cls(path, job)
+        if saved.get("job") != job:
+            print(f"{path} is for a different area. Starting over.")
+            return cls(path, job)
+        return cls(path, job, saved.get("done", 0), saved.get("started", False))
+
+    def save(self):
+        state = asdict(self)
+        del state["path"]
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def _check(response: str) -> str:
+    if response.startswith(COMMAND_ERRORS):
+        raise PregenError(response)
+    return response
+
+
+class ForceloadBackend:
+    name = "forceload"
+
+    def __init__(
+        self, rcon: RconClient, dimension: str = "minecraft:overworld", timeout: float = 120, settle: float = 5
+    ):
+        self.rcon = rcon
+        self.dimension = dimension
+        self.timeout = timeout
+        # Whether `execute if loaded` exists (1.19.4+); otherwise, wait `settle` seconds per tile.
+        self.can_check = True
+        self.settle = settle
+
+    def _run(self, command: str, idempotent: bool = False) -> str:
+        return self.rcon.command(f"execute in {self.dimension} run {command}", idempotent)
+
+    def forced_chunks(self) -> set[tuple[int, int]]:
+        """The chunks force-loaded in the dimension, such as spawn or farm chunks set up by an admin."""
+        return {(int(x), int(z)) for x, z in FORCED_CHUNK.findall(self._run("forceload query", idempotent=True))}
+
+    def _is_loaded(self, x: int, z: int) -> bool:
+        if not self.can_check:
+            return True
+        response = self.rcon.command(f"execute in {self.dimension} if loaded {x * 16} 0 {z * 16}", idempotent=True)
+        if response.startswith(COMMAND_ERRORS):
+            self.can_check = False
+            return True
+        return "passed" in response
+
+    def generate(self, tile: Area):
+        """
+        Force-load a tile until all its chunks are generated, then release it.
+
+        Chunks of the tile that were already force-loaded are force-loaded
+        again once the tile is released.
+        """
+        if tile.chunks > MAX_FORCELOAD:
+            raise PregenError(f"Tiles must be at most {MAX_FORCELOAD} chunks, not {tile.chunks}.")
+        blocks = f"{tile.x1 * 16} {tile.z1 * 16} {tile.x2 * 16 + 15} {tile.z2 * 16 + 15}"
+        kept = [(x, z) for x, z in self.forced_chunks() if tile.x1 <= x <= tile.x2 and tile.z1 <= z <= tile.z2]
+        _check(self._run(f"forceload add {blocks}"))
+        try:
+            pending = [(x, z) for x in range(tile.x1, tile.x2 + 1) for z in range(tile.z1, tile.z2 + 1)]
+            deadline = time.monotonic() + self.timeout
+            while pending and time.monotonic() < deadline:
+                pending = [chunk for chunk in pending if not self._is_loaded(*chunk)]
+                if not self.can_check:
+                    time.sleep(self.settle)
+                    break
+                if pending:
+                    time.sleep(0.5)
+            if pending:
+                print(f"{len(pending)} chunks were still loading after {self.timeout:.0f} seconds.")
+        finally:
+            self._run(f"forceload remove {blocks}")
+            for x, z in kept:
+                self._run(f"forceload add {x * 16} {z * 16}")
+
+
+class ChunkyBackend:
+    """Drive a Chunky task. Chunky walks the area and saves its own progress."""
+
+    name = "chunky"
+
+    def __init__(self, rcon: RconClient, dimension: str = "minecraft:overworld"):
+        self.rcon = rcon
+        self.dimension = dimension
+        self.running = False
+
+    @staticmethod
+    def available(rcon: RconClient) -> bool:
+        return not rcon.command("chunky", idempotent=True).startswith(COMMAND_ERRORS)
+
+    def start(self, area: Area, resume: bool):
+        if resume:
+            _check(self.rcon.command("chunky continue"))
+        else:
+            center_x = (area.x1 + area.x2 + 1) * 8
+            center_z = (area.z1 + area.z2 + 1) * 8
+            for command in [
+                f"chunky world {self.dimension}",
+                "chunky shape rectangle",
+                f"chunky center {center_x} {center_z}",
+                f"chunky radius {(area.x2 - area.x1 + 1) * 8} {(area.z2 - area.z1 + 1) * 8}",
+                "chunky start",
+            ]:
+                _check(self.rcon.command(command))
+        self.running = True
+
+    def pause(self):
+        if self.running:
+            self.rcon.command("chunky pause")
+            self.running = False
+
+    def resume(self):
+        if not self.running:
+            self.rcon.command("chunky continue")
+            self.running = True
+
+    def progress(self) -> float | None:
+        """Percentage done, or `None` once no task is running."""
+        response = ticks.FORMATTING.sub("", self.rcon.command("chunky progress", idempotent=True))
+        if match := re.search(r"([\d.]+)%", response):
+            return float(match[1])
+        return None
+
+
+def sample(rcon: RconClient) -> tuple[int, float | None]:
+    return ticks.count_players(rcon), ticks.query_mspt(rcon)
+
+
+def wait_for_room(rcon: RconClient, throttle: Throttle, interval: float, on_pause=None) -> float:
+    """Wait until the throttle allows generating again. Returns the delay it asks for."""
+    paused = False
+    while (delay := throttle.decide(*(load := sample(rcon)))) is None:
+        if not paused:
+            players, mspt = load
+            tick_time = "unknown" if mspt is None else f"{mspt:.1f} ms"
+            print(f"Pausing: {players} players online, tick time {tick_time}.")
+            if on_pause:
+                on_pause()
+            paused = True
+        time.sleep(interval)
+    if paused:
+        print("Resuming.")
+    return delay
+
+
+def run_forceload(
+    rcon: RconClient, backend: ForceloadBackend, area: Area, tile_size: int, throttle: Throttle, checkpoint: Checkpoint
+):
+    tiles = area.tiles(tile_size)
+    start = time.monotonic()
+    generated = 0
+    if checkpoint.done >= len(tiles):
+        print(f"All {len(tiles)} tiles were already generated.")
+        return
+    if checkpoint.done:
+        print(f"Resuming at tile {checkpoint.done + 1} of {len(tiles)}.")
+    for n in range(checkpoint.done, len(tiles)):
+        time.sleep(wait_for_room(rcon, throttle, interval=30))
+        backend.generate(tiles[n])
+        generated += tiles[n].chunks
+        checkpoint.done = n + 1
+        checkpoint.save()
+        if checkpoint.done % 10 == 0 or checkpoint.done == len(tiles):
+            rate = generated / (time.monotonic() - start)
+            print(f"{checkpoint.done}/{len(tiles)} tiles, {rate:.1f} chunks/s, {throttle.delay:.1f} s between tiles.")
+
+
+def run_chunky(rcon: RconClient, backend: ChunkyBackend, area: Area, throttle: Throttle, checkpoint: Checkpoint):
+    if checkpoint.done:
+        print("Chunky already finished this area.")
+        return
+    wait_for_room(rcon, throttle, interval=30)
+    backend.start(area, resume=checkpoint.started)
+    checkpoint.started = True
+    checkpoint.save()
+    try:
+        # Give the task time to show up in `chunky progress`.
+        time.sleep(5)
+        while True:
+            if throttle.decide(*sample(rcon)) is None:
+                backend.pause()
+                wait_for_room(rcon, throttle, interval=30)
+                backend.resume()
+                time.sleep(5)
+            if (percent := backend.progress()) is None:
+                break
+            print(f"Chunky: {percent:.2f}% done.")
+            time.sleep(30)
+    except BaseException:
+        # Chunky saves the task when paused, for `chunky continue`.
+        backend.pause()
+        raise
+    checkpoint.done = 1
+    checkpoint.save()
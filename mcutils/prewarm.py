@@ -0,0 +1,146 @@
+"""
+Get the next server folder ready before the server switches to it.
+
+A server starting from a cold page cache reads its jars and the region files
+around spawn from disk, which makes up much of its startup time. Reading those
+files ahead of time, while the current server is still running, moves that I/O
+out of the downtime. The reading is done at idle I/O priority (where `ionice`
+is available) and at a bounded rate, so it does not slow the running server.
+
+The folder is also checked for what would keep the server from starting.
+"""
+
+import gzip
+import json
+import os
+import struct
+import subprocess
+import threading
+import time
+from glob import escape, glob
+
+from mcutils import anvil
+from mcutils.server import read_properties
+
+# Spawn chunks stay loaded within 11 chunks of spawn (12 before 1.20.5); round
+# up to a whole number of chunks past that.
+SPAWN_RADIUS = 13 * 16
+REGION_SIZE = 512
+
+
+def check_folder(folder: str) -> list[str]:
+    """Return what would keep the server in `folder` from starting as expected."""
+    problems = []
+    if not os.path.isfile(os.path.join(folder, "server.jar")):
+        problems.append("server.jar is missing.")
+
+    try:
+        with open(os.path.join(folder, "eula.txt"), "r") as f:
+            if "eula=true" not in f.read().replace(" ", "").lower():
+                problems.append("The EULA is not accepted in eula.txt.")
+    except FileNotFoundError:
+        problems.append("eula.txt is missing.")
+
+    try:
+        with open(os.path.join(folder, "mp_args.txt"), "r") as f:
+            if not f.read().strip():
+                problems.append("mp_args.txt is empty.")
+    except FileNotFoundError:
+        pass
+    except (OSError, UnicodeDecodeError) as e:
+        problems.append(f"mp_args.txt cannot be read: {e}")
+
+    level_name = read_properties(folder).get("level-name") or "world"
+    if not os.path.isfile(os.path.join(folder, level_name, "level.dat")):
+        problems.append(f"{level_name}/level.dat is missing, so a new world would be generated.")
+    return problems
+
+
+def read_spawn(level_dat: str) -> tuple[int, int]:
+    """Return the world spawn from `level.dat`, or (0, 0) if it cannot be read."""
+    try:
+        with gzip.open(level_dat, "rb") as f:
+            nbt = f.read()
+        x = anvil.find_number(nbt, "SpawnX", 3, ("Data",))
+        z = anvil.find_number(nbt, "SpawnZ", 3, ("Data",))
+    except (OSError, EOFError, IndexError, ValueError, struct.error):
+        return 0, 0
+    return x or 0, z or 0
+
+
+def files_to_warm(folder: str) -> list[str]:
+    """The jars the server loads, and the world files it reads around spawn."""
+    paths = [os.path.join(folder, "server.jar")]
+    # Since 1.18, server.jar unpacks the actual server and its libraries here.
+    for pattern in ("libraries/**/*.jar", "versions/**/*.jar"):
+        paths += sorted(glob(os.path.join(escape(folder), pattern), recursive=True))
+
+    world = os.path.join(folder, read_properties(folder).get("level-name") or "world")
+    level_dat = os.path.join(world, "level.dat")
+    paths.append(level_dat)
+    spawn_x, spawn_z = read_spawn(level_dat)
+    regions = {
+        (x // REGION_SIZE, z // REGION_SIZE)
+        for x in (spawn_x - SPAWN_RADIUS, spawn_x + SPAWN_RADIUS)
+        for z in (spawn_z - SPAWN_RADIUS, spawn_z + SPAWN_RADIUS)
+    }
+    for kind in ("region", "entities", "poi"):
+        paths += [os.path.join(world, kind, f"r.{x}.{z}.mca") for x, z in sorted(regions)]
+    return [path for path in paths if os.path.isfile(path)]
+
+
+def lower_io_priority():
+    """Move the calling thread to the idle I/O class, if `ionice` is available."""
+    try:
+        subprocess.run(["ionice", "-c", "3", "-p", str(threading.get_native_id())], capture_output=True)
+    except OSError:
+        pass
+
+
+def prewarm(folder: str, rate: float = 50.0, block_size: int = 1024**2) -> tuple[int, int, float]:
+    """
+    Read the files the server in `folder` needs to start into the page cache,
+    at most `rate` megabytes per second. Returns the number of files and bytes
+    read, and how long it took.
+    """
+    lower_io_priority()
+    start = time.monotonic()
+    files = total = 0
+    for path in files_to_warm(folder):
+        try:
+            with open(path, "rb", buffering=0) as f:
+                while n := len(f.read(block_size)):
+                    total += n
+                    # Sleep off any time gained on the rate.
+                    if (ahead := total / (rate * 1024**2) - (time.monotonic() - start)) > 0:
+                        time.sleep(ahead)
+        except OSError as e:
+            print(f"Could not pre-read {path}: {e}")
+            continue
+        files += 1
+    return files, total, time.monotonic() - start
+
+
+class StartupHistory:
+    """The last cold and pre-warmed startup time of each server folder, kept in a JSON file."""
+
+    def __init__(self, path: str = "startup_times.json"):
+        self.path = path
+        try:
+            with open(path, "r") as f:
+                self.times = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.times = {}
+
+    def record(self, folder: str, seconds: float, warm: bool) -> str:
+        """Record a startup time, and describe it next to the other kind."""
+        times = self.times.setdefault(os.path.basename(os.path.abspath(folder)), {})
+        kind, other = ("warm", "cold") if warm else ("cold", "warm")
+        times[kind] = seconds
+        with open(self.path, "w") as f:
+            json.dump(self.times, f, indent=2)
+
+        summary = f"{folder} started in {seconds:.1f} seconds ({'pre-warmed' if warm else 'cold'})."
+        if other in times:
+            summary += f" Its last {other} start took {times[other]:.1f} seconds."
+        return summary
@@ -0,0 +1,139 @@
+"""
+A small TCP forwarder, to switch which server the public port leads to.
+
+`TcpProxy` listens on the public port and connects every new client to the
+current backend. `switch` changes the backend for new connections only;
+connections already open keep going to the server they started on until they
+close (for example, when that server kicks its players and stops). Players can
+then reconnect straight away, and land on the new server.
+
+    python -m mcutils.proxy 25565 localhost:25566
+"""
+
+import argparse
+import socket
+import threading
+import time
+
+from mcutils.metrics import registry
+
+CONNECTIONS = registry.counter("proxy_connections_total", "Connections forwarded by the proxy.")
+FAILED = registry.counter("proxy_failed_connections_total", "Connections dropped because the backend was down.")
+OPEN = registry.gauge("proxy_open_connections", "Connections currently forwarded by the proxy.")
+
+BUFFER_SIZE = 65536
+
+
+class TcpProxy:
+    def __init__(self, port: int, backend: tuple[str, int] = None, host: str = "", connect_timeout: float = 5):
+        self.backend = backend
+        self.connect_timeout = connect_timeout
+        self.lock = threading.Lock()
+        # Open connections: (client, backend socket, backend address).
+        self.connections = set()
+
+        self.listener = socket.create_server((host, port))
+        self.port = self.listener.getsockname()[1]
+        self.closed = False
+
+    def start(self):
+        """Accept connections in a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def switch(self, backend: tuple[str, int]):
+        """Send new connections to `backend` from now on."""
+        self.backend = backend
+
+    def open_connections(self, backend: tuple[str, int] = None) -> int:
+        """The number of open connections, to `backend` or to any backend."""
+        with self.lock:
+            return sum(1 for c in self.connections if backend is None or c[2] == backend)
+
+    def serve_forever(self):
+        while not self.closed:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                # The listener was closed.
+                return
+            threading.Thread(target=self._forward, args=(client,), daemon=True).start()
+
+    def close(self):
+        """Stop accepting connections, and close those still open."""
+        self.closed = True
+        self.listener.close()
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            for sock in connection[:2]:
+                # Wakes up the threads blocked reading from it.
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _forward(self, client: socket.socket):
+        backend = self.backend
+        try:
+            if backend is None:
+                raise ConnectionRefusedError("No backend yet.")
+            upstream = socket.create_connection(backend, self.connect_timeout)
+        except OSError:
+            FAILED.inc()
+            client.close()
+            return
+        upstream.settimeout(None)
+        # Minecraft sends many small packets; don't hold them back.
+        for sock in (client, upstream):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        connection = (client, upstream, backend)
+        with self.lock:
+            self.connections.add(connection)
+        CONNECTIONS.inc()
+        OPEN.set(len(self.connections))
+
+        # One thread per direction; this one copies from the client.
+        replies = threading.Thread(target=_pipe, args=(upstream, client), daemon=True)
+        replies.start()
+        _pipe(client, upstream)
+        replies.join()
+
+        with self.lock:
+            self.connections.discard(connection)
+        OPEN.set(len(self.connections))
+        client.close()
+        upstream.close()
+
+
+def _pipe(source: socket.socket, dest: socket.socket):
+    """Copy from `source` to `dest` until `source` is done, then pass the end of stream on."""
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    try:
+        while n := source.recv_into(buffer):
+            dest.sendall(view[:n])
+    except OSError:
+        pass
+    try:
+        dest.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "localhost", int(port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forward a TCP port to a server.")
+    parser.add_argument("port", type=int)
+    parser.add_argument("backend", type=parse_address, help="host:port")
+    args = parser.parse_args()
+
+    TcpProxy(args.port, args.backend).start()
+    print(f"Forwarding port {args.port} to {args.backend[0]}:{args.backend[1]}.")
+    while True:
+        time.sleep(3600)
@@ -0,0 +1,164 @@
+"""
+A persistent RCON client for the Minecraft server.
+
+Opening an RCON connection costs a TCP handshake and a login round trip. Rather
+than paying that for every command, `RconClient` keeps one authenticated
+connection open, and reconnects transparently if it drops (for example, after
+the server restarts).
+
+The protocol is implemented directly on a socket, so timeouts work from any
+thread, and the client can be pointed at a local fake server.
+See https://wiki.vg/RCON for the packet format.
+"""
+
+import socket
+import struct
+import threading
+import time
+
+from mcutils.metrics import registry
+
+SERVERDATA_AUTH = 3
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_AUTH_FAILED = -1
+
+HEADER = struct.Struct("<iii")
+
+COMMAND_SECONDS = registry.histogram("rcon_command_seconds", "Round-trip time per RCON command.")
+RECONNECTS = registry.counter("rcon_reconnects_total", "Times the RCON connection was reopened.")
+
+
+class RconError(Exception):
+    """Raised when the server sends something unexpected."""
+
+
+class RconAuthError(RconError):
+    """Raised when the RCON password is rejected."""
+
+
+class RconClient:
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 25575,
+        password: str = "",
+        timeout: float = 10,
+        retries: int = 1,
+    ):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.retries = retries
+
+        self.sock = None
+        self.request_id = 0
+        self.lock = threading.Lock()
+
+        # Round-trip statistics, in seconds.
+        self.commands = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.reconnects = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def connect(self):
+        """Open the connection and log in, if not connected already."""
+        if self.sock is not None:
+            return
+        if self.commands:
+            self.reconnects += 1
+            RECONNECTS.inc()
+
+        self.sock = socket.create_connection((self.host, self.port), self.timeout)
+        try:
+            request_id = self._send(SERVERDATA_AUTH, self.password)
+            response_id, _ = self._receive()
+            if response_id == SERVERDATA_AUTH_FAILED:
+                raise RconAuthError("RCON password was rejected.")
+            if response_id != request_id:
+                raise RconError(f"Expected a response to {request_id}, got {response_id}.")
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def command(self, cmd: str, idempotent: bool = False) -> str:
+        """
+        Run a command and return the response.
+
+        If the connection was dropped, reconnect and try again, up to `retries`
+        times. The password being rejected is never retried. Once the command
+        has been sent, the server may already have run it, so it is only sent
+        again if it is `idempotent` (like `list`).
+        """
+        with self.lock:
+            for attempt in range(self.retries + 1):
+                sent = False
+                try:
+                    self.connect()
+                    start = time.perf_counter()
+                    request_id = self._send(SERVERDATA_EXECCOMMAND, cmd)
+                    sent = True
+                    response_id, payload = self._receive()
+                    if response_id != request_id:
+                        raise RconError(f"Expected a response to {request_id}, got {response_id}.")
+                except RconAuthError:
+                    raise
+                except (OSError, RconError):
+                    self.close()
+                    if attempt == self.retries or (sent and not idempotent):
+                        raise
+                    continue
+
+                self._record(time.perf_counter() - start)
+                return payload
+
+    def batch(self, cmds: list[str]) -> list[str]:
+        """Run several commands in order over the same connection."""
+        return [self.command(cmd) for cmd in cmds]
+
+    def stats(self) -> dict:
+        """Round-trip statistics of the commands run so far, in milliseconds."""
+        return {
+            "commands": self.commands,
+            "avg_ms": self.total_time / self.commands * 1000 if self.commands else 0.0,
+            "max_ms": self.max_time * 1000,
+            "reconnects": self.reconnects,
+        }
+
+    def _record(self, elapsed: float):
+        COMMAND_SECONDS.observe(elapsed)
+        self.commands += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def _send(self, packet_type: int, payload: str) -> int:
+        self.request_id = self.request_id % 0x7FFFFFFF + 1
+        data = payload.encode("utf-8") + b"\0\0"
+        header = HEADER.pack(HEADER.size - 4 + len(data), self.request_id, packet_type)
+        self.sock.sendall(header + data)
+        return self.request_id
+
+    def _receive(self) -> tuple[int, str]:
+        length, request_id, _ = HEADER.unpack(self._read(HEADER.size))
+        payload = self._read(length - (HEADER.size - 4))
+        return request_id, payload[:-2].decode("utf-8", errors="replace")
+
+    def _read(self, n: int) -> bytes:
+        data = b""
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("RCON connection closed by the server.")
+            data += chunk
+        return data
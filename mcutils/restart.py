@@ -0,0 +1,127 @@
+"""
+Decide when the server should restart, based on how it is doing.
+
+Instead of restarting at the same time every day, the server is sampled every
+few minutes: how many players are online, how long ticks take and how much the
+host is stalling on memory. A restart is due once the server has been degrading
+for a while, or has simply been up for too long. It is then scheduled for the
+hour that has historically been the emptiest, with the usual warnings counted
+down from that time.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+# Warnings sent before a restart: how long before, the color and the message.
+WARNINGS = [
+    (timedelta(hours=1), "#FAA61A", "an hour"),
+    (timedelta(minutes=30), "#FAA61A", "30 minutes"),
+    (timedelta(minutes=15), "#F04747", "15 minutes"),
+    (timedelta(minutes=5), "#F04747", "5 minutes"),
+    (timedelta(seconds=60), "#F04747", "60 seconds"),
+    (timedelta(seconds=10), "#F04747", "10 seconds"),
+]
+
+
+def memory_pressure() -> float | None:
+    """
+    Return how much the host is stalling on memory, as a percentage.
+
+    Uses the kernel's pressure stall information: the share of the last 60
+    seconds in which some task waited on memory. Returns `None` if it is not
+    available (before Linux 4.20, or with PSI disabled).
+    """
+    try:
+        with open("/proc/pressure/memory", "r") as f:
+            # some avg10=0.00 avg60=0.00 avg300=0.00 total=0
+            some = f.readline().split()
+        return float(some[2].split("=")[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+@dataclass
+class RestartPolicy:
+    min_uptime: timedelta = timedelta(hours=6)
+    max_uptime: timedelta = timedelta(days=3)
+    # A sample is degraded above either threshold.
+    mspt_threshold: float = 50.0
+    # Percent of time stalled on memory, from `memory_pressure`.
+    memory_threshold: float = 20.0
+    # How many degraded samples in a row make a restart due.
+    degraded_samples: int = 3
+    history_file: str = "restart_history.json"
+
+    degraded: int = field(default=0, init=False)
+    # Average number of players online for each hour of the day.
+    hourly_players: list[float | None] = field(default=None, init=False)
+
+    def __post_init__(self):
+        try:
+            with open(self.history_file, "r") as f:
+                self.hourly_players = json.load(f)["hourly_players"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self.hourly_players = [None] * 24
+
+    def record(self, now: datetime, players: int, mspt: float | None, memory: float | None):
+        """Record a sample of the server's load."""
+        previous = self.hourly_players[now.hour]
+        # Moving average, so the history follows changes in when people play.
+        self.hourly_players[now.hour] = players if previous is None else 0.9 * previous + 0.1 * players
+        # Replaced in one step, so a crash never leaves half a history.
+        with open(f"{self.history_file}.tmp", "w") as f:
+            json.dump({"hourly_players": self.hourly_players}, f)
+        os.replace(f"{self.history_file}.tmp", self.history_file)
+
+        is_degraded = (mspt is not None and mspt > self.mspt_threshold) or (
+            memory is not None and memory > self.memory_threshold
+        )
+        self.degraded = self.degraded + 1 if is_degraded else 0
+
+    def due(self, uptime: timedelta) -> str | None:
+        """Return why a restart is due, or `None` if it is not."""
+        if uptime < self.min_uptime:
+            return None
+        if self.degraded >= self.degraded_samples:
+            return f"degraded for {self.degraded} samples in a row"
+        if uptime >= self.max_uptime:
+            return f"up for {uptime}"
+        return None
+
+    def choose_time(self, now: datetime, players: int) -> datetime:
+        """
+        Pick when to restart.
+
+        In a minute if nobody is online; only the 10-second warning is left in
+        the countdown then, in case someone joins meanwhile. Otherwise, the
+        emptiest hour of the next 24 hours that leaves room for the full
+        countdown. If the server is degrading, only the next 6 hours are
+        considered.
+        """
+        if players == 0:
+            return now + timedelta(minutes=1)
+
+        horizon = 6 if self.degraded >= self.degraded_samples else 24
+        first = now.replace(minute=1, second=0, microsecond=0) + timedelta(hours=1)
+        if first - now < WARNINGS[0][0]:
+            first += timedelta(hours=1)
+
+        candidates = [first + timedelta(hours=i) for i in range(horizon)]
+        # Hours without any history yet count as busy, but not busier than
+        # hours where people actually played.
+        busiest = max((p for p in self.hourly_players if p is not None), default=0)
+        return min(
+            candidates,
+            key=lambda t: busiest if self.hourly_players[t.hour] is None else self.hourly_players[t.hour],
+        )
+
+    @staticmethod
+    def countdown(restart_at: datetime, now: datetime) -> list[tuple[datetime, str, str]]:
+        """The warnings to send before `restart_at`, skipping any that are already past."""
+        return [
+            (restart_at - before, color, label)
+            for before, color, label in WARNINGS
+            if restart_at - before > now
+        ]
@@ -0,0 +1,221 @@
+"""
+Track the Minecraft server through a restart.
+
+Instead of sleeping for a fixed amount of time after `stop`, wait until the old
+JVM has actually let go of everything the new one needs: the process (or the
+`screen` session it runs in) has exited, the world's `session.lock` is released
+and the server port is free. Then, watch the console for the "Done" line to
+measure how long the server was down.
+"""
+
+import fcntl
+import os
+import queue
+import re
+import socket
+import subprocess
+import time
+from collections.abc import Iterator
+
+from mcutils.metrics import registry
+
+DONE_PATTERN = re.compile(r"\]: Done \((?P<seconds>[\d.]+)s\)!")
+
+SHUTDOWN_SECONDS = registry.gauge("server_last_shutdown_seconds", "How long the last shutdown took.")
+DOWNTIME_SECONDS = registry.gauge("server_last_downtime_seconds", "How long the server was down in the last restart.")
+STARTUP_SECONDS = registry.gauge("server_last_startup_seconds", "Startup time reported by the last server start.")
+RESTARTS = registry.counter("server_restarts_total", "Restarts completed since this script started.")
+
+
+def read_properties(folder: str) -> dict[str, str]:
+    """Read the server.properties file of a server folder."""
+    properties = {}
+    try:
+        with open(os.path.join(folder, "server.properties"), "r") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#") and "=" in line:
+                    key, value = line.split("=", 1)
+                    properties[key.strip()] = value.strip()
+    except FileNotFoundError:
+        pass
+    return properties
+
+
+def write_properties(folder: str, updates: dict[str, str]):
+    """Set keys in the server.properties file of a server folder, keeping the rest of it as it is."""
+    path = os.path.join(folder, "server.properties")
+    try:
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        lines = []
+
+    remaining = dict(updates)
+    for i, line in enumerate(lines):
+        key = line.split("=", 1)[0].strip()
+        if "=" in line and not line.lstrip().startswith("#") and key in remaining:
+            lines[i] = f"{key}={remaining.pop(key)}"
+    lines += [f"{key}={value}" for key, value in remaining.items()]
+    with open(f"{path}.tmp", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(f"{path}.tmp", path)
+
+
+def get_server_port(folder: str) -> int:
+    return int(read_properties(folder).get("server-port") or 25565)
+
+
+def is_port_free(port: int) -> bool:
+    """Check whether nothing is listening on a TCP port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind(("", port))
+        except OSError:
+            return False
+    return True
+
+
+def is_world_locked(folder: str) -> bool:
+    """Check whether a server still holds the lock on its world."""
+    level_name = read_properties(folder).get("level-name") or "world"
+    try:
+        fd = os.open(os.path.join(folder, level_name, "session.lock"), os.O_RDWR)
+    except FileNotFoundError:
+        return False
+
+    try:
+        fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return True
+    else:
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+        return False
+    finally:
+        os.close(fd)
+
+
+def is_screen_running(session: str) -> bool:
+    """Check whether a `screen` session with the given name exists."""
+    try:
+        output = subprocess.run(["screen", "-list", session], capture_output=True, text=True).stdout
+    except FileNotFoundError:
+        return False
+    return f".{session}\t" in output
+
+
+def wait_until_stopped(
+    folder: str,
+    process: subprocess.Popen = None,
+    session: str = "mc_server",
+    timeout: float = 300,
+    interval: float = 0.5,
+    port: int = None,
+) -> float | None:
+    """
+    Wait for the server in `folder` to shut down completely.
+
+    The server is tracked through `process` if it was started as a child
+    process, or through its `screen` session otherwise. `port` is the server
+    port, if it was not taken from server.properties. Returns how long it took
+    in seconds, or `None` if it was still running after `timeout`.
+    """
+    port = port or get_server_port(folder)
+    start = time.monotonic()
+
+    while time.monotonic() - start < timeout:
+        running = process.poll() is None if process else is_screen_running(session)
+        if not running and not is_world_locked(folder) and is_port_free(port):
+            SHUTDOWN_SECONDS.set(elapsed := time.monotonic() - start)
+            return elapsed
+        time.sleep(interval)
+    return None
+
+
+def is_port_open(port: int, host: str = "127.0.0.1") -> bool:
+    """Check whether something accepts TCP connections on a port."""
+    try:
+        with socket.create_connection((host, port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def get_identity(path: str) -> tuple[int, int] | None:
+    """Return the inode and modification time of a file, if it exists."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def follow_log(path: str, old: tuple[int, int] | None, timeout: float, interval: float = 0.5) -> Iterator[str]:
+    """
+    Yield the lines of a new `latest.log` as they are written.
+
+    The server replaces `latest.log` when it starts, so lines are only read
+    once the file's identity (see `get_identity`) differs from `old`. Stops
+    after `timeout`.
+    """
+    deadline = time.monotonic() + timeout
+    f = None
+    try:
+        while time.monotonic() < deadline:
+            if f is None and get_identity(path) not in (old, None):
+                f = open(path, "r", errors="replace")
+            if f is not None:
+                while line := f.readline():
+                    yield line
+            time.sleep(interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def drain_queue(q: queue.Queue, timeout: float) -> Iterator[str]:
+    """Yield lines from a console stream queue until `timeout` runs out."""
+    deadline = time.monotonic() + timeout
+    while (remaining := deadline - time.monotonic()) > 0:
+        try:
+            yield q.get(timeout=remaining)
+        except queue.Empty:
+            return
+
+
+def wait_until_ready(lines: Iterator[str], port: int, timeout: float = 30) -> float | None:
+    """
+    Wait for the "Done" line of a starting server, then up to `timeout` for it
+    to accept connections on `port`. Returns the startup time the server
+    reported, or `None` if it did not get that far.
+    """
+    for line in lines:
+        if match := DONE_PATTERN.search(line):
+            deadline = time.monotonic() + timeout
+            while not is_port_open(port):
+                if time.monotonic() > deadline:
+                    return None
+                time.sleep(0.5)
+            return float(match["seconds"])
+    return None
+
+
+def report_startup(lines: Iterator[str], stopped_at: float) -> float | None:
+    """
+    Wait for the "Done" line, then report how long the server was down.
+    Returns the startup time the server reported, if it finished starting.
+    """
+    for line in lines:
+        if match := DONE_PATTERN.search(line):
+            downtime = time.monotonic() - stopped_at
+            print(
+                f"Server is back up after {downtime:.1f} seconds of downtime "
+                f"(startup took {match['seconds']} seconds)."
+            )
+            DOWNTIME_SECONDS.set(downtime)
+            STARTUP_SECONDS.set(float(match["seconds"]))
+            RESTARTS.inc()
+            return float(match["seconds"])
+    print("Did not see the server finish starting up.")
+    return None
@@ -0,0 +1,43 @@
+import os
+import sys
+
+# mcutils lives two folders up.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from mcutils.pregen import Area, ForceloadBackend
+
+
+class ForceloadServer:
+    """Keeps track of force-loaded chunks, answering `forceload` like the server does."""
+
+    def __init__(self, forced: set[tuple[int, int]]):
+        self.forced = set(forced)
+
+    def command(self, cmd: str, idempotent: bool = False) -> str:
+        words = cmd.split(" run ", 1)[-1].split()
+        if "if" in words and "loaded" in words:
+            return "Test passed"
+        if words[:2] == ["forceload", "query"]:
+            chunks = ", ".join(f"[{x}, {z}]" for x, z in sorted(self.forced))
+            return f"{len(self.forced)} force loaded chunks were found in minecraft:overworld at: {chunks}"
+        action, *blocks = words[1:]
+        x1, z1 = int(blocks[0]) // 16, int(blocks[1]) // 16
+        x2, z2 = (int(blocks[2]) // 16, int(blocks[3]) // 16) if len(blocks) == 4 else (x1, z1)
+        chunks = {(x, z) for x in range(x1, x2 + 1) for z in range(z1, z2 + 1)}
+        if action == "add":
+            self.forced |= chunks
+        else:
+            self.forced -= chunks
+        return "Marked chunks to be force loaded"
+
+
+def test_forceload_keeps_chunks_that_were_already_forced():
+    server = ForceloadServer({(0, 0), (2, -1), (50, 50)})
+    backend = ForceloadBackend(server)
+    for tile in Area(-4, -4, 3, 3).tiles(4):
+        backend.generate(tile)
+    assert server.forced == {(0, 0), (2, -1), (50, 50)}
+
+
+def test_forced_chunks_without_any():
+    backend = ForceloadBackend(ForceloadServer(set()))
+    assert backend.forced_chunks() == set()
@@ -0,0 +1,95 @@
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+# mcutils lives two folders up.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from mcutils.rcon import HEADER, SERVERDATA_AUTH, SERVERDATA_AUTH_FAILED, RconAuthError, RconClient
+
+
+class FakeRcon:
+    """Answers each command with "ran <command>", and can drop the connection on purpose."""
+
+    def __init__(self, password: str = "secret"):
+        self.password = password
+        self.ran = []
+        # Close the connection after receiving this command, before answering it.
+        self.drop_on = None
+        self.connections = 0
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn: socket.socket):
+        with conn:
+            while len(header := conn.recv(HEADER.size, socket.MSG_WAITALL)) == HEADER.size:
+                length, request_id, packet_type = HEADER.unpack(header)
+                payload = conn.recv(length - (HEADER.size - 4), socket.MSG_WAITALL)[:-2].decode()
+                if packet_type == SERVERDATA_AUTH:
+                    response_id = request_id if payload == self.password else SERVERDATA_AUTH_FAILED
+                    response = ""
+                else:
+                    self.ran.append(payload)
+                    if payload == self.drop_on:
+                        self.drop_on = None
+                        return
+                    response_id, response = request_id, f"ran {payload}"
+                data = response.encode() + b"\0\0"
+                conn.sendall(HEADER.pack(HEADER.size - 4 + len(data), response_id, 2) + data)
+
+
+@pytest.fixture
+def server():
+    fake = FakeRcon()
+    yield fake
+    fake.listener.close()
+
+
+def test_batch_uses_one_connection(server):
+    with RconClient("127.0.0.1", server.port, "secret", timeout=5) as rcon:
+        assert rcon.batch(["list", "save-all", "seed"]) == ["ran list", "ran save-all", "ran seed"]
+        assert rcon.stats()["commands"] == 3
+    assert server.connections == 1
+
+
+def test_wrong_password(server):
+    rcon = RconClient("127.0.0.1", server.port, "wrong", timeout=5, retries=3)
+    with pytest.raises(RconAuthError):
+        rcon.command("list")
+    assert server.ran == []
+    assert server.connections == 1
+
+
+def test_reconnects_after_the_connection_drops(server):
+    rcon = RconClient("127.0.0.1", server.port, "secret", timeout=5)
+    assert rcon.command("list") == "ran list"
+    # The server restarts: the old connection is gone.
+    rcon.sock.shutdown(socket.SHUT_RDWR)
+    assert rcon.command("list") == "ran list"
+    assert rcon.stats()["reconnects"] == 1
+    rcon.close()
+
+
+def test_does_not_resend_a_command_that_may_have_run(server):
+    rcon = RconClient("127.0.0.1", server.port, "secret", timeout=5)
+    server.drop_on = "stop"
+    with pytest.raises(ConnectionError):
+        rcon.command("stop")
+    assert server.ran == ["stop"]
+
+    server.drop_on = "list"
+    assert rcon.command("list", idempotent=True) == "ran list"
+    assert server.ran == ["stop", "list", "list"]
+    rcon.close()
@@ -0,0 +1,78 @@
+"""
+Read the server's load over RCON.
+
+Tick performance is reported differently depending on the server:
+
+* vanilla 1.20.3+ has `tick query`, which reports the average time per tick;
+* Paper has `mspt`, which reports the average tick time directly;
+* Forge has `forge tps`, which reports the mean tick time;
+* Spigot/Paper also have `tps`, from which the tick time can only be estimated.
+
+The first command that gives a readable answer is remembered and used from
+then on.
+"""
+
+import re
+
+from mcutils.rcon import RconClient
+
+# Minecraft formatting codes, like "§a".
+FORMATTING = re.compile(r"§.")
+
+
+def _tick_query(response: str) -> float | None:
+    if match := re.search(r"Average time per tick: ([\d.]+) ?ms", response):
+        return float(match[1])
+    return None
+
+
+def _mspt(response: str) -> float | None:
+    # "Server tick times (avg/min/max) from last 5s, 10s, 1m: ◴ 1.2/0.8/3.4, ..."
+    if match := re.search(r"([\d.]+)/[\d.]+/[\d.]+", response):
+        return float(match[1])
+    return None
+
+
+def _forge_tps(response: str) -> float | None:
+    if match := re.search(r"Overall: Mean tick time: ([\d.]+) ms", response):
+        return float(match[1])
+    return None
+
+
+def _tps(response: str) -> float | None:
+    # "TPS from last 1m, 5m, 15m: 20.0, 19.8, 19.9". A full 20 TPS only means
+    # ticks take at most 50 ms, so this is a rough estimate.
+    if match := re.search(r"TPS from last [^:]*: \*?([\d.]+)", response):
+        tps = float(match[1])
+        return 1000 / tps if tps else None
+    return None
+
+
+TICK_COMMANDS = [
+    ("tick query", _tick_query),
+    ("mspt", _mspt),
+    ("forge tps", _forge_tps),
+    ("tps", _tps),
+]
+
+_working_command = None
+
+
+def query_mspt(rcon: RconClient) -> float | None:
+    """Return the average milliseconds per tick, or `None` if the server does not say."""
+    global _working_command
+
+    commands = [_working_command] if _working_command else TICK_COMMANDS
+    for command, parse in commands:
+        response = FORMATTING.sub("", rcon.command(command, idempotent=True))
+        if (mspt := parse(response)) is not None:
+            _working_command = command, parse
+            return mspt
+    return None
+
+
+def count_players(rcon: RconClient) -> int:
+    """Return the number of players online, from the `list` command."""
+    # "There are 3 of a max of 20 players online: ..."
+    match = re.search(r"(\d+)", FORMATTING.sub("", rcon.command("list", idempotent=True)))
+    return int(match[1]) if match else 0
@@ -15,4 +15,4 @@ java --version
 pip --version
 firewalld
 
-pip install mcrcon schedule
+pip install schedule
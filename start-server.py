@@ -1,13 +1,41 @@
 """
 Launch Minecraft server and restart it every 24 hours.
-Place script
+
+Place this script in the server folder, along with the `mcutils` folder from
+the repo root (the RCON client, restart policy and metrics it uses), and run it
+from there. It also needs `schedule` (`pip install schedule`).
+
+Set `MC_RESTART_POLICY=adaptive` to restart based on load instead: the server
+is sampled every few minutes (players online, tick time and memory pressure),
+and once a restart is due it is scheduled for the emptiest hour, with the
+warnings counted down from then. See mcutils/restart.py.
+
+By default, the server runs detached in a `screen` session. Set
+`MC_SUPERVISED=1` to instead run it as a child process of this script: its
+console output is then relayed to this terminal and streamed, line by line, to
+any reader connected to the Unix socket at `MC_CONSOLE_SOCKET` (for example,
+the coordinate scraper in webhooks/).
+
+Set `MC_METRICS_PORT` to serve Prometheus metrics (restart durations, players
+online, tick time, RCON round trips) at http://127.0.0.1:<port>/metrics.
 """
 
 import time
 import os
 import json
+import queue
+import shlex
+import socket
+import subprocess
+import threading
+from datetime import datetime
+
 import schedule
-from mcrcon import MCRcon
+
+from mcutils import server, ticks
+from mcutils.metrics import registry
+from mcutils.rcon import RconClient, RconError
+from mcutils.restart import RestartPolicy, memory_pressure
 
 SERVER_FOLDER = "."
 LAUNCH_ARGS = "-Xms16G -Xmx16G -XX:+UseG1GC -XX:+ParallelRefProcEnabled -XX:MaxGCPauseMillis=200 -XX:+UnlockExperimentalVMOptions -XX:+DisableExplicitGC -XX:+AlwaysPreTouch -XX:G1NewSizePercent=30 -XX:G1MaxNewSizePercent=40 -XX:G1HeapRegionSize=8M -XX:G1ReservePercent=20 -XX:G1HeapWastePercent=5 -XX:G1MixedGCCountTarget=4 -XX:InitiatingHeapOccupancyPercent=15 -XX:G1MixedGCLiveThresholdPercent=90 -XX:G1RSetUpdatingPauseTimePercent=5 -XX:SurvivorRatio=32 -XX:+PerfDisableSharedMem -XX:MaxTenuringThreshold=1"
@@ -17,6 +45,21 @@ START_TIME = time.time()
 RCON_PASSWORD = os.environ["MC_RCON_PASSWORD"]
 RCON_PORT = int(os.environ["MC_RCON_PORT"])
 
+SUPERVISED = os.getenv("MC_SUPERVISED", "0") == "1"
+CONSOLE_SOCKET = os.getenv("MC_CONSOLE_SOCKET", "console.sock")
+SCREEN_SESSION = "mc_server"
+
+# How long to wait for the server to shut down, and then to start up again.
+STOP_TIMEOUT = int(os.getenv("MC_STOP_TIMEOUT", 300))
+STARTUP_TIMEOUT = int(os.getenv("MC_STARTUP_TIMEOUT", 600))
+
+# "daily" restarts at 02:01 every day, "adaptive" restarts based on load.
+RESTART_POLICY = os.getenv("MC_RESTART_POLICY", "daily")
+# How often the load is sampled for the adaptive policy, in minutes.
+SAMPLE_INTERVAL = int(os.getenv("MC_SAMPLE_INTERVAL", 5))
+# Serve Prometheus metrics on this port, if set.
+METRICS_PORT = int(os.getenv("MC_METRICS_PORT") or 0)
+
 YELLOW = "#FAA61A"
 RED = "#F04747"
 
@@ -36,11 +79,118 @@ def get_launch_args(folder):
         return LAUNCH_ARGS
 
 
+class ConsoleStream:
+    """
+    Fan out the lines of the server console to any number of readers.
+
+    Each reader gets its own bounded queue. A reader that falls behind loses
+    its oldest lines instead of holding up the server.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.readers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue(self.maxsize)
+        with self.lock:
+            self.readers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.readers.remove(q)
+
+    def publish(self, line):
+        with self.lock:
+            readers = list(self.readers)
+        for q in readers:
+            while True:
+                try:
+                    q.put_nowait(line)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def serve(self, path):
+        """Stream the console to every client that connects to a Unix socket."""
+        if os.path.exists(path):
+            os.remove(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen()
+        print(f"Streaming the console to {os.path.abspath(path)}")
+
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=self._send_lines, args=(conn,), daemon=True).start()
+
+    def _send_lines(self, conn):
+        q = self.subscribe()
+        try:
+            while True:
+                conn.sendall((q.get() + "\n").encode())
+        except OSError:
+            pass
+        finally:
+            self.unsubscribe(q)
+            conn.close()
+
+
+console = ConsoleStream()
+server_process = None
+
+
+def pump_console(process):
+    """Relay the server's output to this terminal and to the console stream."""
+    for line in process.stdout:
+        print(line, end="")
+        console.publish(line.rstrip("\n"))
+    print(f"Server exited with code {process.wait()}.")
+
+
+def start_supervised_server():
+    """Start the server as a child process and stream its console."""
+    global server_process
+
+    launch_args = get_launch_args(SERVER_FOLDER)
+    cmd = ["java", *shlex.split(launch_args), "-jar", "server.jar", "nogui"]
+
+    print()
+    print("> " + shlex.join(cmd))
+
+    server_process = subprocess.Popen(
+        cmd,
+        cwd=os.path.abspath(SERVER_FOLDER),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace",
+        bufsize=1,
+    )
+    threading.Thread(target=pump_console, args=(server_process,), daemon=True).start()
+
+
+server_started_at = datetime.now()
+
+
 def start_server():
     """Open a new terminal window and start the server."""
+    global server_started_at, restart_planned
+
+    server_started_at = datetime.now()
+    restart_planned = False
+    if SUPERVISED:
+        return start_supervised_server()
+
     launch_args = get_launch_args(SERVER_FOLDER)
     cmd = (
-        f"screen -S mc_server -dm bash -c"
+        f"screen -S {SCREEN_SESSION} -dm bash -c"
         f" \"cd '{os.path.abspath(SERVER_FOLDER)}';"
         f' java {launch_args} -jar server.jar nogui"'
     )
@@ -51,11 +201,11 @@ def start_server():
     os.system(cmd)
 
 
+rcon = RconClient("localhost", RCON_PORT, RCON_PASSWORD, timeout=10)
+
+
 def send_command(cmd):
-    with MCRcon(
-        host="localhost", password=RCON_PASSWORD, port=RCON_PORT, timeout=10
-    ) as mc:
-        print("[CONSOLE] " + mc.command(cmd))
+    print("[CONSOLE] " + rcon.command(cmd))
 
 
 def warn_server(color, time):
@@ -71,25 +221,112 @@ def warn_server(color, time):
     print(f"Sent a warning that the server will restart in {time}.")
 
 
+def watch_startup(stopped_at):
+    """Report the downtime once the server has started, without blocking the scheduler."""
+    if SUPERVISED:
+        q = console.subscribe()
+        lines = server.drain_queue(q, STARTUP_TIMEOUT)
+    else:
+        log = os.path.join(SERVER_FOLDER, "logs", "latest.log")
+        lines = server.follow_log(log, server.get_identity(log), STARTUP_TIMEOUT)
+
+    def report():
+        server.report_startup(lines, stopped_at)
+        if SUPERVISED:
+            console.unsubscribe(q)
+
+    threading.Thread(target=report, daemon=True).start()
+
+
 def stop_and_start_server():
-    send_command("kick @a The server is restarting. Service will resume momentarily.")
-    send_command("stop")
-    print("Sent a request to stop the server. Will relaunch in 60 seconds.")
-    time.sleep(60)
+    global restart_planned
+
+    stopped_at = time.monotonic()
+    for msg in rcon.batch(
+        ["kick @a The server is restarting. Service will resume momentarily.", "stop"]
+    ):
+        print("[CONSOLE] " + msg)
+    # The server closes the connection as it stops.
+    rcon.close()
+    print("RCON: {commands} commands, {avg_ms:.1f} ms average, {max_ms:.1f} ms max.".format(**rcon.stats()))
+    print("Sent a request to stop the server. Waiting for it to shut down.")
+
+    elapsed = server.wait_until_stopped(
+        SERVER_FOLDER, process=server_process, session=SCREEN_SESSION, timeout=STOP_TIMEOUT
+    )
+    if elapsed is None:
+        print(f"The server is still running after {STOP_TIMEOUT} seconds. Not relaunching.")
+        # Let the adaptive policy plan another restart.
+        restart_planned = False
+        return
+    print(f"The server shut down in {elapsed:.1f} seconds. Relaunching.")
+
+    watch_startup(stopped_at)
     start_server()
 
 
-schedule.every().day.at("01:00").do(warn_server, YELLOW, "an hour")
-schedule.every().day.at("01:30").do(warn_server, YELLOW, "30 minutes")
-schedule.every().day.at("01:45").do(warn_server, RED, "15 minutes")
-schedule.every().day.at("01:55").do(warn_server, RED, "5 minutes")
-schedule.every().day.at("01:59").do(warn_server, RED, "60 seconds")
-schedule.every().day.at("02:00").do(warn_server, RED, "10 seconds")
-schedule.every().day.at("02:01").do(stop_and_start_server)
+policy = RestartPolicy()
+restart_planned = False
+# Jobs planned for the adaptive restart, as (when, job, args), soonest first.
+planned = []
+
+
+def run_planned():
+    """Run the planned jobs whose time has come."""
+    while planned and datetime.now() >= planned[0][0]:
+        _, job, args = planned.pop(0)
+        job(*args)
+
+
+def check_load():
+    """Sample the server's load, and schedule a restart if one is due."""
+    global restart_planned
+
+    try:
+        players = ticks.count_players(rcon)
+        mspt = ticks.query_mspt(rcon)
+    except (OSError, RconError) as e:
+        print(f"Could not sample the server load: {e}")
+        return
+
+    now = datetime.now()
+    memory = memory_pressure()
+    policy.record(now, players, mspt, memory)
+    registry.gauge("server_players_online", "Players online at the last load sample.").set(players)
+    if mspt is not None:
+        registry.gauge("server_mspt", "Milliseconds per tick at the last load sample.").set(mspt)
+    if memory is not None:
+        registry.gauge("host_memory_pressure", "Memory pressure at the last load sample, in percent.").set(memory)
+    if restart_planned or not (reason := policy.due(now - server_started_at)):
+        return
+
+    restart_at = policy.choose_time(now, players)
+    print(f"A restart is due ({reason}). Restarting at {restart_at:%H:%M}.")
+    for warn_at, color, label in policy.countdown(restart_at, now):
+        planned.append((warn_at, warn_server, (color, label)))
+    planned.append((restart_at, stop_and_start_server, ()))
+    restart_planned = True
+
+
+if RESTART_POLICY == "adaptive":
+    schedule.every(SAMPLE_INTERVAL).minutes.do(check_load)
+else:
+    schedule.every().day.at("01:00").do(warn_server, YELLOW, "an hour")
+    schedule.every().day.at("01:30").do(warn_server, YELLOW, "30 minutes")
+    schedule.every().day.at("01:45").do(warn_server, RED, "15 minutes")
+    schedule.every().day.at("01:55").do(warn_server, RED, "5 minutes")
+    schedule.every().day.at("01:59").do(warn_server, RED, "60 seconds")
+    schedule.every().day.at("02:00").do(warn_server, RED, "10 seconds")
+    schedule.every().day.at("02:01").do(stop_and_start_server)
 
 
 if __name__ == "__main__":
+    if SUPERVISED:
+        threading.Thread(target=console.serve, args=(CONSOLE_SOCKET,), daemon=True).start()
+    if METRICS_PORT:
+        registry.serve(METRICS_PORT)
     start_server()
     while True:
         schedule.run_pending()
+        run_planned()
         time.sleep(5)
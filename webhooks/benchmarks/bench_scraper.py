@@ -0,0 +1,225 @@
+"""
+Benchmark the coordinate scraper on synthetic logs.
+
+Three benchmarks are run, each in its own process so that peak memory is
+measured separately:
+
+* parse: `PlayerMessage.from_log_entry`, `CoordinateEntry.from_message` and
+  `get_coordinates` on lines held in memory, and `get_coordinates` on the raw
+  bytes read through `LineReader`;
+* scrape_all: the first run over a log folder made by `generate_logs.py`;
+* poll: steady state, where lines are appended to `latest.log` and
+  `check_for_coords` is called after each batch, like `run_webhooks.py` does.
+
+    python webhooks/benchmarks/generate_logs.py /tmp/logs --size 1G --archives 8
+    python webhooks/benchmarks/bench_scraper.py /tmp/logs --save results.json
+    python webhooks/benchmarks/bench_scraper.py /tmp/logs --compare results.json
+
+With `--compare`, the script exits with an error if any throughput dropped by
+more than `--tolerance` (or any latency grew by as much) against the saved
+results.
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+from generate_logs import LogGenerator, LogProfile
+
+# The scraper lives one folder up.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Which direction is better for each result, for `--compare`.
+HIGHER_IS_BETTER = {"lines_per_sec", "messages_per_sec", "coords_per_sec"}
+LOWER_IS_BETTER = {"p50_ms", "p95_ms", "max_ms"}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process and its finished children, in MB."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def bench_parse(args) -> dict:
+    from coords_scraper import CHAT_MARKER, CoordinateEntry, LineReader, PlayerMessage, get_coordinates
+
+    buffer = io.BytesIO()
+    LogGenerator(profile(args), args.seed).write(buffer, args.parse_size)
+    lines = buffer.getvalue().decode().splitlines()
+
+    start = time.perf_counter()
+    messages = [m for line in lines if (m := PlayerMessage.from_log_entry(line))]
+    from_log_entry = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for message in messages:
+        CoordinateEntry.from_message(message.content)
+    from_message = time.perf_counter() - start
+
+    start = time.perf_counter()
+    coords = sum(1 for _ in get_coordinates(lines, date.today()))
+    pipeline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sum(1 for _ in get_coordinates(LineReader(buffer, prefilter=[CHAT_MARKER]), date.today()))
+    from_bytes = time.perf_counter() - start
+
+    return {
+        "from_log_entry": {"lines": len(lines), "lines_per_sec": len(lines) / from_log_entry},
+        "from_message": {"messages": len(messages), "messages_per_sec": len(messages) / from_message},
+        "get_coordinates": {"lines": len(lines), "coords": coords, "lines_per_sec": len(lines) / pipeline},
+        "line_reader": {"lines": len(lines), "lines_per_sec": len(lines) / from_bytes},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_scrape_all(args) -> dict:
+    from coords_scraper import LINES_SCANNED, scrape_all
+
+    folder = os.path.abspath(args.folder)
+    try:
+        with open(os.path.join(folder, "generated.json"), "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = None
+
+    # `scrape_all` keeps its state files in the working directory.
+    os.chdir(tempfile.mkdtemp())
+    start = time.perf_counter()
+    coords, _ = scrape_all(folder)
+    elapsed = time.perf_counter() - start
+
+    # Lines read by backfill workers are not counted in this process, so
+    # prefer the generator's own count.
+    lines = sum(f["lines"] for f in manifest.values()) if manifest else LINES_SCANNED.value
+    return {
+        "scrape_all": {"lines": lines, "coords": len(coords), "seconds": elapsed, "lines_per_sec": lines / elapsed},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def bench_poll(args) -> dict:
+    from coords_scraper import check_for_coords, scrape_all
+
+    folder = tempfile.mkdtemp()
+    os.chdir(folder)
+    os.mkdir("logs")
+    generator = LogGenerator(profile(args), args.seed)
+    with open("logs/latest.log", "wb") as f:
+        generator.write(f, args.poll_initial)
+    _, last_read = scrape_all("logs")
+    last_read.commit(force=True)
+
+    latencies = []
+    lines = 0
+    for _ in range(args.polls):
+        with open("logs/latest.log", "ab") as f:
+            lines += generator.write(f, args.poll_size)
+        start = time.perf_counter()
+        _, last_read = check_for_coords("logs")
+        latencies.append(time.perf_counter() - start)
+        last_read.commit(force=True)
+
+    return {
+        "poll": {
+            "polls": len(latencies),
+            "lines": lines,
+            "lines_per_sec": lines / sum(latencies),
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "max_ms": max(latencies) * 1000,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+BENCHMARKS = {"parse": bench_parse, "scrape_all": bench_scrape_all, "poll": bench_poll}
+
+
+def profile(args) -> LogProfile:
+    return LogProfile(args.chat_ratio, args.coord_ratio, args.paper_ratio)
+
+
+def run(name: str) -> dict:
+    """Run one benchmark in a fresh process, and return its results."""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--only", name],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+    # The scraper prints as it goes; the results are the last line.
+    results = json.loads(output.strip().splitlines()[-1])
+    print(f"{name}:")
+    for key, value in results.items():
+        print(f"  {key}: {value}")
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return a description of every result that is worse than the baseline by more than `tolerance`."""
+    regressions = []
+    for name, sections in baseline.items():
+        for section, values in sections.items():
+            if not isinstance(values, dict):
+                continue
+            for key, old in values.items():
+                new = results.get(name, {}).get(section, {}).get(key)
+                if new is None:
+                    continue
+                if key in HIGHER_IS_BETTER and new < old * (1 - tolerance):
+                    regressions.append(f"{section}.{key}: {new:.0f} (was {old:.0f})")
+                elif key in LOWER_IS_BETTER and new > old * (1 + tolerance):
+                    regressions.append(f"{section}.{key}: {new:.1f} (was {old:.1f})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("folder", help="log folder made by generate_logs.py, for the scrape_all benchmark")
+    parser.add_argument("--parse-size", type=int, default=50 * 1024**2, help="bytes of lines to parse in memory")
+    parser.add_argument("--poll-initial", type=int, default=100 * 1024**2, help="size of latest.log before polling")
+    parser.add_argument("--poll-size", type=int, default=256 * 1024, help="bytes appended before each poll")
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--chat-ratio", type=float, default=0.05)
+    parser.add_argument("--coord-ratio", type=float, default=0.1)
+    parser.add_argument("--paper-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown for --compare (default: 0.2)")
+    parser.add_argument("--only", choices=BENCHMARKS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.only:
+        print(json.dumps(BENCHMARKS[args.only](args)))
+        sys.exit()
+
+    results = {name: run(name) for name in BENCHMARKS}
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions.")
@@ -0,0 +1,211 @@
+"""
+Generate synthetic Minecraft server logs for benchmarking the coordinate scraper.
+
+Writes a `latest.log` and any number of rotated `YYYY-MM-DD-n.log.gz` archives
+to a folder, mixing chat messages (some of them with coordinates) with the
+usual server noise: joins, advancements, "Can't keep up!" warnings, entity
+deaths and so on. The output only depends on the seed, so two runs with the
+same arguments produce the same bytes.
+
+    python webhooks/benchmarks/generate_logs.py logs --size 2G --archives 10 --archive-size 200M
+
+A `generated.json` file is written alongside the logs with the number of lines
+and (uncompressed) bytes in each file, for the benchmark to compare against.
+"""
+
+import argparse
+import gzip
+import json
+import math
+import os
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import BinaryIO
+
+# Lines are generated in blocks that share a timestamp, which keeps generating
+# multi-GB files reasonably fast.
+BLOCK_LINES = 500
+
+WORDS = (
+    "the base is near village portal nether end farm iron gold spawner slime chunk mesa mushroom island "
+    "come here look at this found a stronghold anyone want to trade diamonds emeralds lol ok brb gg "
+    "where is it i think we should build a road to highway ice boat tunnel"
+).split()
+ADVANCEMENTS = ("Stone Age", "Acquire Hardware", "We Need to Go Deeper", "Diamonds!", "The End?", "Monster Hunter")
+MOBS = ("Villager", "Zombie", "Skeleton", "Creeper", "Iron Golem", "Wandering Trader")
+
+
+@dataclass
+class LogProfile:
+    # Share of lines that are chat messages.
+    chat_ratio: float = 0.05
+    # Share of chat messages that contain coordinates.
+    coord_ratio: float = 0.1
+    # Share of chat messages logged by Paper's async chat thread instead of the
+    # vanilla server thread.
+    paper_ratio: float = 0.0
+    players: int = 20
+
+
+class LogGenerator:
+    def __init__(self, profile: LogProfile, seed: int = 0):
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.players = [f"Player{i:02}" for i in range(profile.players)]
+
+    def coords(self) -> str:
+        """A chat message containing coordinates, in one of the ways players type them."""
+        rng = self.rng
+        x, y, z = rng.randint(-30000, 30000), rng.randint(-64, 320), rng.randint(-30000, 30000)
+        label = " ".join(rng.choices(WORDS, k=rng.randint(0, 4)))
+        coords = rng.choice((f"{x} {y} {z}", f"{x}, {y}, {z}", f"{x} {z}", f"{x};{y};{z}", f"{x}.5 {y} {z}.5"))
+        if not label:
+            return coords
+        return f"{label} {coords}" if rng.random() < 0.5 else f"{coords} {label}"
+
+    def chat(self) -> str:
+        rng = self.rng
+        if rng.random() < self.profile.coord_ratio:
+            content = self.coords()
+        else:
+            content = " ".join(rng.choices(WORDS, k=rng.randint(1, 12)))
+
+        if rng.random() < self.profile.paper_ratio:
+            thread = f"Async Chat Thread - #{rng.randint(0, 15)}"
+        else:
+            thread = "Server thread"
+        return f"[{thread}/INFO]: <{rng.choice(self.players)}> {content}"
+
+    def noise(self) -> str:
+        """A log line that is not a chat message."""
+        rng = self.rng
+        player = rng.choice(self.players)
+        x, y, z = rng.uniform(-30000, 30000), rng.uniform(-64, 320), rng.uniform(-30000, 30000)
+        kind = rng.randrange(8)
+        if kind == 0:
+            return f"[Server thread/INFO]: {player} joined the game"
+        if kind == 1:
+            return f"[Server thread/INFO]: {player} left the game"
+        if kind == 2:
+            return (
+                f"[Server thread/INFO]: {player}[/127.0.0.1:{rng.randint(30000, 60000)}] logged in with entity id "
+                f"{rng.randint(1, 10**6)} at ({x:.2f}, {y:.2f}, {z:.2f})"
+            )
+        if kind == 3:
+            ms = rng.randint(2000, 20000)
+            return (
+                "[Server thread/WARN]: Can't keep up! Is the server overloaded? "
+                f"Running {ms}ms or {ms // 50} ticks behind"
+            )
+        if kind == 4:
+            return f"[Server thread/INFO]: {player} has made the advancement [{rng.choice(ADVANCEMENTS)}]"
+        if kind == 5:
+            mob = rng.choice(MOBS)
+            return (
+                f"[Server thread/INFO]: {mob} ['{mob}'/{rng.randint(1, 10**6)}, l='ServerLevel[world]', "
+                f"x={x:.2f}, y={y:.2f}, z={z:.2f}] died, message: '{mob} was slain by {player}'"
+            )
+        if kind == 6:
+            uuid = rng.randbytes(16).hex()
+            return f"[User Authenticator #{rng.randint(1, 9)}/INFO]: UUID of player {player} is {uuid}"
+        return "[Server thread/INFO]: Saving the game (this may take a moment!)"
+
+    def line(self) -> str:
+        return self.chat() if self.rng.random() < self.profile.chat_ratio else self.noise()
+
+    def write(self, f: BinaryIO, size: int, start_seconds: int = 0, end_seconds: int = 86400) -> int:
+        """
+        Write about `size` bytes of log lines to `f`, and return the number of lines.
+
+        Timestamps go from `start_seconds` to `end_seconds` into the day, in
+        proportion to how much has been written.
+        """
+        written = lines = 0
+        while written < size:
+            seconds = start_seconds + (end_seconds - start_seconds) * written // size
+            stamp = f"[{seconds // 3600 % 24:02}:{seconds // 60 % 60:02}:{seconds % 60:02}] "
+            block = "".join(f"{stamp}{self.line()}\n" for _ in range(BLOCK_LINES)).encode()
+            f.write(block)
+            written += len(block)
+            lines += BLOCK_LINES
+        return lines
+
+
+def parse_size(size: str) -> int:
+    """Parse a size like "500M" or "2G" into bytes."""
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    if size[-1:].upper() in units:
+        return int(float(size[:-1]) * units[size[-1].upper()])
+    return int(size)
+
+
+def archive_names(count: int, per_day: int, latest_date: date) -> list[str]:
+    """Names of `count` archives rolled over before `latest_date`, oldest first."""
+    days = math.ceil(count / per_day)
+    names = [
+        f"{latest_date - timedelta(days=d):%Y-%m-%d}-{n}.log.gz"
+        for d in range(days, 0, -1)
+        for n in range(1, per_day + 1)
+    ]
+    return names[len(names) - count :]
+
+
+def generate(
+    folder: str,
+    size: int,
+    archives: int = 0,
+    archive_size: int = 0,
+    per_day: int = 2,
+    profile: LogProfile = None,
+    seed: int = 0,
+    latest_date: date = date(2024, 1, 31),
+    compresslevel: int = 6,
+) -> dict:
+    """Write the logs to `folder`. Returns the manifest of lines and bytes per file."""
+    profile = profile or LogProfile()
+    os.makedirs(folder, exist_ok=True)
+    manifest = {}
+
+    # Each file gets its own seed, so no two files are the same.
+    for i, name in enumerate(archive_names(archives, per_day, latest_date)):
+        n = int(name.rsplit("-", 1)[1].split(".")[0])
+        span = 86400 // per_day
+        with gzip.open(os.path.join(folder, name), "wb", compresslevel=compresslevel) as f:
+            lines = LogGenerator(profile, seed + i + 1).write(f, archive_size, span * (n - 1), span * n)
+            manifest[name] = {"lines": lines, "bytes": f.tell()}
+        print(f"Wrote {name}")
+
+    with open(os.path.join(folder, "latest.log"), "wb") as f:
+        lines = LogGenerator(profile, seed).write(f, size)
+        manifest["latest.log"] = {"lines": lines, "bytes": f.tell()}
+    print("Wrote latest.log")
+
+    with open(os.path.join(folder, "generated.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("folder", help="where to write the logs")
+    parser.add_argument("--size", default="100M", help="size of latest.log, like 500M or 2G (default: 100M)")
+    parser.add_argument("--archives", type=int, default=0, help="number of .log.gz archives (default: 0)")
+    parser.add_argument("--archive-size", default="50M", help="uncompressed size of each archive (default: 50M)")
+    parser.add_argument("--per-day", type=int, default=2, help="archives rolled over per day (default: 2)")
+    parser.add_argument("--chat-ratio", type=float, default=0.05, help="share of lines that are chat")
+    parser.add_argument("--coord-ratio", type=float, default=0.1, help="share of chat with coordinates")
+    parser.add_argument("--paper-ratio", type=float, default=0.0, help="share of chat in Paper's format")
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(
+        args.folder,
+        parse_size(args.size),
+        args.archives,
+        parse_size(args.archive_size),
+        args.per_day,
+        LogProfile(args.chat_ratio, args.coord_ratio, args.paper_ratio, args.players),
+        args.seed,
+    )
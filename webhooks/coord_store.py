@@ -0,0 +1,216 @@
+"""
+Keep every scraped coordinate in a local SQLite database, to search them later.
+
+Coordinates are indexed with an R-tree on (x, z), so looking up everything in
+an area, or the entries nearest to a point, only touches the entries nearby.
+Usernames and timestamps have regular indexes. Posting the same coordinates
+with the same comment again does not add a new entry; the entry's `posts`
+count and `last_posted` time are updated instead, and reading the same log
+lines twice changes nothing.
+
+    python webhooks/coord_store.py import path/to/logs
+    python webhooks/coord_store.py box -- -500 -500 500 500
+    python webhooks/coord_store.py near 1200 -3400 -n 5
+    python webhooks/coord_store.py player Steve
+"""
+
+import argparse
+import math
+import sqlite3
+import time
+from collections.abc import Iterable
+from datetime import datetime
+from pathlib import Path
+
+from coords_scraper import COORDS, CoordinateEntry, LastRead, archive_key, dispatch, parse_saved, read_from_latest
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS coords (
+    id INTEGER PRIMARY KEY,
+    x REAL NOT NULL,
+    y REAL,
+    z REAL NOT NULL,
+    comment TEXT,
+    username TEXT,
+    -- ISO 8601 timestamps in UTC, so they sort chronologically.
+    first_posted TEXT,
+    last_posted TEXT,
+    posts INTEGER NOT NULL DEFAULT 1
+);
+CREATE UNIQUE INDEX IF NOT EXISTS coords_post ON coords (username, x, IFNULL(y, 'none'), z, IFNULL(comment, ''));
+CREATE INDEX IF NOT EXISTS coords_username ON coords (username COLLATE NOCASE, first_posted);
+CREATE INDEX IF NOT EXISTS coords_first_posted ON coords (first_posted);
+CREATE VIRTUAL TABLE IF NOT EXISTS coords_rtree USING rtree (id, min_x, max_x, min_z, max_z);
+"""
+
+UPSERT = """
+INSERT INTO coords (x, y, z, comment, username, first_posted, last_posted)
+VALUES (:x, :y, :z, :comment, :username, :dt, :dt)
+ON CONFLICT (username, x, IFNULL(y, 'none'), z, IFNULL(comment, '')) DO UPDATE SET
+    posts = posts + (excluded.last_posted > last_posted),
+    last_posted = MAX(last_posted, excluded.last_posted)
+"""
+
+COLUMNS = "c.x, c.y, c.z, c.comment, c.username, c.first_posted"
+
+# Twice the distance to the world border, so a circle this big around any
+# point in the world covers all of it.
+WORLD_RADIUS = 60_000_000
+
+
+class CoordStore:
+    def __init__(self, path: str = "coords.db"):
+        # Polls run in a worker thread, but never two at a time.
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM coords").fetchone()[0]
+
+    def add_many(self, coords: Iterable[CoordinateEntry]):
+        """Add the coordinates found in one poll, in a single transaction."""
+        rows = [
+            {
+                "x": c.x,
+                "y": c.y,
+                "z": c.z,
+                "comment": c.comment,
+                "username": c.username,
+                "dt": c.dt.isoformat() if c.dt else None,
+            }
+            for c in coords
+        ]
+        if not rows:
+            return
+        with self.db:
+            # New rows always get a higher id than every existing one, so only
+            # those need to be added to the R-tree.
+            last_id = self.db.execute("SELECT IFNULL(MAX(id), 0) FROM coords").fetchone()[0]
+            self.db.executemany(UPSERT, rows)
+            self.db.execute(
+                "INSERT INTO coords_rtree SELECT id, x, x, z, z FROM coords WHERE id > ?",
+                (last_id,),
+            )
+
+    def in_box(self, x1: float, z1: float, x2: float, z2: float, limit: int = 100) -> list[CoordinateEntry]:
+        """Entries with x and z within the given corners, newest first."""
+        x1, x2 = sorted((x1, x2))
+        z1, z2 = sorted((z1, z2))
+        # The R-tree stores 32-bit floats rounded outwards, so an entry on the
+        # edge of the box may only overlap it there. The R-tree finds the
+        # entries overlapping the box, and the exact bounds are checked on the
+        # table.
+        rows = self.db.execute(
+            f"""
+            SELECT {COLUMNS} FROM coords_rtree r JOIN coords c ON c.id = r.id
+            WHERE r.max_x >= :x1 AND r.min_x <= :x2 AND r.max_z >= :z1 AND r.min_z <= :z2
+              AND c.x BETWEEN :x1 AND :x2 AND c.z BETWEEN :z1 AND :z2
+            ORDER BY c.first_posted DESC LIMIT :limit
+            """,
+            {"x1": x1, "x2": x2, "z1": z1, "z2": z2, "limit": limit},
+        )
+        return [to_entry(row) for row in rows]
+
+    def nearest(self, x: float, z: float, n: int = 10) -> list[tuple[float, CoordinateEntry]]:
+        """
+        The `n` entries closest to (x, z), with their horizontal distance.
+
+        The R-tree has no nearest-neighbour search, so ever larger circles
+        around the point are searched (through their bounding square) until
+        one holds `n` entries, which guarantees no closer entry was missed.
+        """
+        n = min(n, len(self))
+        radius = 64.0
+        while True:
+            rows = self.db.execute(
+                f"""
+                SELECT {COLUMNS}, (c.x - :x) * (c.x - :x) + (c.z - :z) * (c.z - :z) AS distance
+                FROM coords_rtree r JOIN coords c ON c.id = r.id
+                WHERE r.max_x >= :x - :r AND r.min_x <= :x + :r AND r.max_z >= :z - :r AND r.min_z <= :z + :r
+                  AND distance <= :r * :r
+                ORDER BY distance LIMIT :n
+                """,
+                {"x": x, "z": z, "r": radius, "n": n},
+            ).fetchall()
+            if len(rows) >= n or radius >= WORLD_RADIUS:
+                return [(math.sqrt(row[-1]), to_entry(row[:-1])) for row in rows]
+            radius *= 4
+
+    def by_player(self, username: str, since: datetime = None, limit: int = 100) -> list[CoordinateEntry]:
+        """Everything a player posted, newest first."""
+        rows = self.db.execute(
+            f"""
+            SELECT {COLUMNS} FROM coords c
+            WHERE c.username = ? COLLATE NOCASE AND c.first_posted >= ?
+            ORDER BY c.first_posted DESC LIMIT ?
+            """,
+            (username, since.isoformat() if since else "", limit),
+        )
+        return [to_entry(row) for row in rows]
+
+
+def to_entry(row: tuple) -> CoordinateEntry:
+    x, y, z, comment, username, dt = row
+    return CoordinateEntry(x, y, z, comment, username, datetime.fromisoformat(dt) if dt else None)
+
+
+def import_logs(store: CoordStore, log_folder: str):
+    """Add the coordinates from every log file in `log_folder`, without touching `last_read.json`."""
+    log_folder = Path(log_folder)
+    last_read = LastRead()
+    for log_file in sorted(log_folder.glob("*.log.gz"), key=lambda p: archive_key(p.name)):
+        store.add_many(dispatch(parse_saved(log_file, last_read, [COORDS])))
+    store.add_many(read_from_latest(log_folder, last_read))
+
+
+def format_entry(entry: CoordinateEntry) -> str:
+    y = "~" if entry.y is None else f"{entry.y:g}"
+    return f"{entry.dt:%Y-%m-%d %H:%M}  {entry.username:<16}  {entry.x:g} {y} {entry.z:g}  {entry.comment or ''}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the coordinates scraped from the logs.")
+    parser.add_argument("--db", default="coords.db", help="database file (default: coords.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help="add every coordinate in a log folder")
+    command.add_argument("log_folder")
+
+    command = commands.add_parser("box", help="coordinates within an area")
+    for arg in "x1", "z1", "x2", "z2":
+        command.add_argument(arg, type=float)
+    command.add_argument("--limit", type=int, default=100)
+
+    command = commands.add_parser("near", help="coordinates closest to a point")
+    command.add_argument("x", type=float)
+    command.add_argument("z", type=float)
+    command.add_argument("-n", type=int, default=10)
+
+    command = commands.add_parser("player", help="coordinates posted by a player")
+    command.add_argument("username")
+    command.add_argument("--since", type=datetime.fromisoformat)
+    command.add_argument("--limit", type=int, default=100)
+
+    args = parser.parse_args()
+    store = CoordStore(args.db)
+    start = time.perf_counter()
+
+    if args.command == "import":
+        import_logs(store, args.log_folder)
+        print(f"{len(store)} entries in {args.db}.")
+    elif args.command == "box":
+        for entry in store.in_box(args.x1, args.z1, args.x2, args.z2, args.limit):
+            print(format_entry(entry))
+    elif args.command == "near":
+        for distance, entry in store.nearest(args.x, args.z, args.n):
+            print(f"{distance:10.0f} m  {format_entry(entry)}")
+    elif args.command == "player":
+        for entry in store.by_player(args.username, args.since, args.limit):
+            print(format_entry(entry))
+
+    print(f"({(time.perf_counter() - start) * 1000:.1f} ms)")
@@ -6,7 +6,9 @@ and roll over logs once the day passes or the size of `latest.log` is
 sufficiently large.
 
 To poll for changes, we look for entries in the `latest.log` file and keep track
-of how far we've read. This is tracked using a JSON file `last_read.json`.
+of how far we've read as a byte offset, so each poll only reads the new data.
+This is tracked using a JSON file `last_read.json`, along with the inode and
+size of `latest.log` to detect when it was replaced or truncated.
 
 To also scrape any coordinates in older log files or if the logs were rolled
 over in between polling cycle, we also keep track of the last log file that was
@@ -14,49 +16,269 @@ processed in the same file.
 """
 
 import gzip
+import hashlib
 import json
 import os
 import re
-from dataclasses import dataclass
-from datetime import datetime, date, time, timezone
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, date, time
+from itertools import repeat
 from pathlib import Path
+from time import monotonic
+from typing import BinaryIO
 
 from discord import Embed
 
+from log_events import EXTRACTORS, Extractor, enabled_extractors, extract, log_datetime, markers, register
+from metrics import registry
+
+# Number of processes used to parse saved log files on the first run.
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS") or os.cpu_count() or 1)
+# Minimum number of seconds between writes of `last_read.json`.
+CHECKPOINT_INTERVAL = int(os.getenv("CHECKPOINT_INTERVAL", 60))
+# How long to wait for the archive of a replaced `latest.log` before giving up
+# on it and reading the new `latest.log` from the start.
+ARCHIVE_WAIT = int(os.getenv("ARCHIVE_WAIT", 300))
+
+LINES_SCANNED = registry.counter("coords_lines_scanned_total", "Log lines scanned for coordinates.")
+BYTES_READ = registry.counter("coords_bytes_read_total", "Bytes of (decompressed) logs read.")
+
+# Every chat message has this right before the username, so lines without it
+# can be skipped before they are even decoded.
+CHAT_MARKER = "]: <"
+# Player messages are always an [INFO] event. The thread name varies (Paper
+# servers log them from "[Async Chat Thread - #N/INFO]").
+CHAT_PATTERN = re.compile(r"\[(?P<time>\d\d:\d\d:\d\d)\] \[[^\]]*INFO\]: <(?P<username>[^>]+)> (?P<content>.+)")
+COORDS_PATTERN = re.compile(r"(-?\d+(?:\.\d+)?)[, ;]+(-?\d+(?:\.\d+)?)[, ;]*(-?\d+(?:\.\d+)?)?")
+
+
+def write_json_atomic(path: str, data):
+    """Write JSON to a temporary file, then rename it over `path`."""
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+
+    # Make sure the rename itself survives a crash.
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def archive_key(name: str) -> tuple[date, int]:
+    """
+    Sort key for a saved log file name, in the format YYYY-MM-DD-n.log.gz.
+
+    Sorting by name alone would put "2024-01-01-10" before "2024-01-01-2".
+    Names that do not follow the format sort first.
+    """
+    try:
+        return date.fromisoformat(name[:10]), int(name[11:].split(".")[0])
+    except ValueError:
+        return date.min, 0
+
+
+@dataclass
+class LogCatalog:
+    """
+    Persistent manifest of the saved log files in the log folder.
+
+    The folder is only listed again when its modification time changes, which
+    happens when Minecraft rolls `latest.log` over into a new archive (writing
+    to `latest.log` does not change it). Otherwise, finding the archives that
+    have not been read yet is a binary search.
+    """
+
+    folder_mtime: int = 0
+    archives: dict[str, dict] = field(default_factory=dict)
+
+    # The catalog is kept in memory between polls once loaded.
+    loaded = None
+
+    def __post_init__(self):
+        self.sort()
+
+    def sort(self):
+        """Sort the archive names chronologically for `after`."""
+        self.names = sorted(self.archives, key=archive_key)
+        self.keys = [archive_key(name) for name in self.names]
+
+    @classmethod
+    def load(cls):
+        """Load the catalog from a JSON file, or start an empty one."""
+        if cls.loaded is None:
+            try:
+                with open("log_catalog.json", "r") as f:
+                    cls.loaded = cls(**json.load(f))
+            except FileNotFoundError:
+                cls.loaded = cls()
+        return cls.loaded
+
+    def write(self):
+        """Atomically save the catalog to a JSON file."""
+        write_json_atomic(
+            "log_catalog.json", {"folder_mtime": self.folder_mtime, "archives": self.archives}
+        )
+
+    def refresh(self, log_folder: Path, last_read: str = ""):
+        """
+        Catalog any saved log files that appeared, changed or disappeared.
+
+        Archives that appear out of order (older than `last_read`, the last
+        archive that was read) are cataloged but will not be read. Archives
+        that log4j is still writing (their uncompressed `.log` is still there)
+        are left for a later refresh.
+        """
+        folder_mtime = os.stat(log_folder).st_mtime_ns
+        if folder_mtime == self.folder_mtime:
+            return
+
+        seen = set()
+        writing = False
+        for entry in os.scandir(log_folder):
+            if not entry.name.endswith(".log.gz"):
+                continue
+            seen.add(entry.name)
+            if entry.name not in self.archives and os.path.exists(entry.path[: -len(".gz")]):
+                writing = True
+                continue
+            stat = entry.stat()
+            known = self.archives.get(entry.name)
+            if known and (known["size"], known["mtime"]) == (stat.st_size, stat.st_mtime):
+                continue
+
+            digest = file_digest(entry.path)
+            if known and known["digest"] != digest:
+                print(f"{entry.name} changed since it was cataloged.")
+            elif not known and last_read and archive_key(entry.name) <= archive_key(last_read):
+                print(f"{entry.name} appeared out of order, it will not be read.")
+            self.archives[entry.name] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "digest": digest,
+            }
+
+        for name in self.archives.keys() - seen:
+            print(f"{name} is no longer in the log folder.")
+            del self.archives[name]
+
+        # Deleting the `.log` once compressed changes the folder's modification
+        # time, but list the folder again next time either way.
+        self.folder_mtime = 0 if writing else folder_mtime
+        self.sort()
+        self.write()
+
+    def after(self, last_read: str) -> list[str]:
+        """Return the names of the archives newer than `last_read`, oldest first."""
+        return self.names[bisect_right(self.keys, archive_key(last_read)) :]
+
+
+def file_digest(path: str) -> str:
+    """Return the SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 @dataclass
 class LastRead:
     log_file: str = ""
-    line_number: int = 0
+    offset: int = 0
+    inode: int | None = None
+    size: int = 0
 
-    @classmethod
-    def init(cls):
-        cls().write()
-        return cls
+    # The state last written to disk and when, shared by all instances, and
+    # the newest committed state that is still waiting to be written.
+    committed = None
+    committed_at = 0.0
+    pending = None
 
     @classmethod
     def load(cls):
-        """Load the last read log file and line number from a JSON file."""
+        """
+        Load the last read log file and byte offset from a JSON file.
+
+        A committed state that has not been written yet takes precedence, so
+        entries that were already delivered are not read again.
+        """
+        if cls.pending is not None:
+            return replace(cls.pending)
+        if cls.committed is not None:
+            return replace(cls.committed)
         try:
             with open("last_read.json", "r") as f:
                 data = json.load(f)
-                return cls(**data)
+                # Ignore keys from older versions (e.g. `line_number`).
+                last_read = cls(**{k: v for k, v in data.items() if k in cls.__annotations__})
         except FileNotFoundError:
             return None
+        LastRead.committed = replace(last_read)
+        return last_read
 
     def write(self):
-        """Save the current state to a JSON file."""
-        with open("last_read.json", "w") as f:
-            json.dump(self.__dict__, f)
+        """
+        Atomically save the current state to a JSON file.
+
+        The state is written to a temporary file which then replaces the old
+        one, so a crash will never leave a half-written `last_read.json`.
+        """
+        write_json_atomic("last_read.json", asdict(self))
+
+    def update(
+        self,
+        log_file: str = None,
+        offset: int = None,
+        inode: int = None,
+        size: int = None,
+    ):
+        """
+        Update the log file, byte offset and file identity.
 
-    def update(self, log_file: str = None, line_number: int = None):
-        """Update the log file and line number, and save the state."""
+        This only changes the state in memory. Call `commit` once everything
+        read up to this point has been delivered.
+        """
         self.log_file = self.log_file if log_file is None else log_file
-        self.line_number = self.line_number if line_number is None else line_number
+        self.offset = self.offset if offset is None else offset
+        self.inode = self.inode if inode is None else inode
+        self.size = self.size if size is None else size
+
+    def commit(self, force: bool = False):
+        """
+        Save the state after the entries read up to it have been delivered.
+
+        Writes are batched: unless `force` is set, the state is only written
+        once `CHECKPOINT_INTERVAL` seconds have passed since the last write.
+        Otherwise it is kept as pending until the next commit or `flush`. A
+        crash in between can only cause entries to be sent again, never skipped.
+        """
+        if self == LastRead.committed:
+            LastRead.pending = None
+            return
+        if not force and monotonic() - LastRead.committed_at < CHECKPOINT_INTERVAL:
+            LastRead.pending = replace(self)
+            return
+
         self.write()
+        LastRead.committed = replace(self)
+        LastRead.committed_at = monotonic()
+        LastRead.pending = None
 
+    @classmethod
+    def flush(cls):
+        """Write the pending state, if any, regardless of the interval."""
+        if cls.pending is not None:
+            cls.pending.commit(force=True)
 
-@dataclass
+
+@dataclass(slots=True)
 class CoordinateEntry:
     x: float
     y: float | None
@@ -64,6 +286,8 @@ class CoordinateEntry:
     comment: str | None
     username: str = None
     dt: datetime = None
+    # Where reading should resume once this entry has been delivered.
+    checkpoint: LastRead = field(default=None, repr=False, compare=False)
 
     @classmethod
     def from_message(cls, message: str):
@@ -73,10 +297,7 @@ class CoordinateEntry:
         As loosely as possible, tries to look for a pair or triplet of numbers
         separated by commas, space, or semicolons. Returns `None` if not found.
         """
-        res = re.search(
-            r"(-?\d+(?:\.\d+)?)[, ;]+(-?\d+(?:\.\d+)?)[, ;]*(-?\d+(?:\.\d+)?)?", message
-        )
-
+        res = COORDS_PATTERN.search(message)
         if res is None:
             return None
 
@@ -115,7 +336,7 @@ class CoordinateEntry:
         return embed
 
 
-@dataclass
+@dataclass(slots=True)
 class PlayerMessage:
     time: time
     username: str
@@ -131,92 +352,232 @@ class PlayerMessage:
         "[Async Chat Thread - #N/INFO]").Returns `None` if the log entry is not
         a player message.
         """
-        res = re.match(
-            r"\[(?P<time>\d\d:\d\d:\d\d)\] \[.+INFO\]: <(?P<username>.+)> (?P<content>.+)",
-            log_entry,
+        if CHAT_MARKER not in log_entry or not (res := CHAT_PATTERN.match(log_entry)):
+            return None
+        return cls(
+            time=time.fromisoformat(res["time"]),
+            username=res["username"],
+            content=res["content"],
         )
-        if res:
-            d = res.groupdict()
-            return cls(
-                time=time.fromisoformat(d["time"]),
-                username=d["username"],
-                content=d["content"],
-            )
-        return None
 
 
-def get_coordinates(log_entries: list[str], log_date: date) -> list[CoordinateEntry]:
-    """Extract coordinate entries from log entries."""
-    coords = []
-    for line in log_entries:
-        player_message = PlayerMessage.from_log_entry(line)
-        if not player_message:
-            continue
+class LineReader:
+    """
+    Decode a binary log stream one line at a time from a byte offset.
 
-        coord = CoordinateEntry.from_message(player_message.content)
-        if not coord:
-            continue
-        coord.dt = datetime.combine(log_date, player_message.time, timezone.utc)
-        coord.username = player_message.username
-        coords.append(coord)
-    return coords
+    `offset` always points just past the last line yielded, so it can be used
+    as a checkpoint for whatever was extracted from that line. A trailing line
+    without a newline (one that is still being written) is only read if
+    `partial` is set. If `prefilter` is given, lines that contain none of its
+    markers are skipped without being decoded.
+    """
 
+    def __init__(self, f: BinaryIO, offset: int = 0, partial: bool = True, prefilter: list[str] = None):
+        self.f = f
+        self.offset = offset
+        self.partial = partial
+        self.prefilter = None
+        if prefilter:
+            self.prefilter = re.compile(b"|".join(re.escape(marker.encode()) for marker in prefilter)).search
+
+    def __iter__(self) -> Iterator[str]:
+        self.f.seek(self.offset)
+        start, lines = self.offset, 0
+        prefilter = self.prefilter
+        try:
+            for line in self.f:
+                if not self.partial and not line.endswith(b"\n"):
+                    break
+                self.offset += len(line)
+                lines += 1
+                if prefilter is not None and not prefilter(line):
+                    continue
+                yield line.decode(errors="replace").rstrip("\r\n")
+        finally:
+            # Counted once per file rather than per line, to keep the loop tight.
+            LINES_SCANNED.inc(lines)
+            BYTES_READ.inc(self.offset - start)
+
+
+def _build_coordinate(chat: re.Match, log_date: date) -> CoordinateEntry | None:
+    # Nothing is built until the message turns out to have coordinates.
+    coord = CoordinateEntry.from_message(chat["content"])
+    if coord:
+        coord.dt = log_datetime(chat, log_date)
+        coord.username = chat["username"]
+    return coord
+
+
+# Coordinates are always extracted; other log events only once enabled.
+COORDS = register(Extractor("coords", CHAT_MARKER, CHAT_PATTERN, _build_coordinate, enabled=True))
+
+
+def get_coordinates(log_entries: Iterable[str], log_date: date) -> Iterator[CoordinateEntry]:
+    """
+    Extract coordinate entries from log entries.
 
-def read_from_saved(log_file: Path) -> list[CoordinateEntry]:
+    This is a generator, so log entries are consumed lazily and only the
+    coordinate entries found so far are ever held by the caller. Most lines
+    are not chat and are rejected by a substring check; the rest are matched
+    against the chat pattern, and nothing is built until coordinates are found.
     """
-    Read from a SAVED log file, ending with .log.gz.
+    for _, coord in extract(log_entries, log_date, [COORDS]):
+        yield coord
+
+
+def dispatch(events: Iterable[tuple[Extractor, object]]) -> Iterator[CoordinateEntry]:
+    """Send log events to their extractor's sink, and yield the coordinate entries."""
+    for extractor, event in events:
+        if extractor is COORDS:
+            yield event
+        elif extractor.sink is not None:
+            extractor.sink(event)
+
+
+def parse_saved(
+    log_file: Path, last_read: LastRead, extractors: list[Extractor] = None
+) -> Iterator[tuple[Extractor, object]]:
+    """
+    Parse a SAVED log file, ending with .log.gz, from the `last_read` byte offset.
 
-    Starts from the`last_read` line number and will update the `last_read`
-    log file name and set the line number to zero (0).
+    Yields the events found by `extractors` (the enabled ones by default), in
+    a single pass. Each coordinate entry's checkpoint points just past the
+    line it was found on, so an interrupted delivery can resume partway
+    through the file. `last_read` itself is not modified, so this is safe to
+    run in a worker process.
     """
-    with gzip.open(log_file, "r") as f:
+    extractors = extractors or enabled_extractors()
+    with gzip.open(log_file, "rb") as f:
         print(f"Reading from {log_file.name}")
         # Boldly assume log file name is in the format: YYYY-MM-DD-n.log.gz
-        log_date = date(*(int(i) for i in log_file.name.split("-")[:3]))
-        log_entries = f.read().decode().splitlines()
+        log_date, _ = archive_key(log_file.name)
+
+        reader = LineReader(f, last_read.offset, prefilter=markers(extractors))
+        for extractor, event in extract(reader, log_date, extractors):
+            if extractor is COORDS:
+                event.checkpoint = replace(last_read, offset=reader.offset)
+            yield extractor, event
+
+
+def read_from_saved(log_file: Path, last_read: LastRead) -> Iterator[CoordinateEntry]:
+    """
+    Read from a SAVED log file, ending with .log.gz.
+
+    Starts from the `last_read` byte offset and, once the file is exhausted,
+    will update the `last_read` log file name and set the offset to zero (0).
+
+    A saved log file is the rolled-over `latest.log`, so an offset into
+    `latest.log` is also a valid offset into the decompressed archive. The
+    archive is decompressed incrementally, so memory use does not grow with
+    the size of the log.
+    """
+    try:
+        yield from dispatch(parse_saved(log_file, last_read))
+    except EOFError:
+        print(f"{log_file.name} ends early, it will be read again on the next poll.")
+        raise
+    # Reaching the end checks the gzip trailer (CRC and length), so only a
+    # complete archive is marked as read.
+    last_read.update(log_file=log_file.name, offset=0, size=0)
+    # The offset now points at the start of whichever `latest.log` came next.
+    last_read.inode = None
+
+
+def _parse_saved_to_list(log_file: Path, previous: str, names: list[str]) -> list[tuple[str, object]]:
+    """
+    Fully parse a saved log file in a worker process.
+
+    Extractors are passed by name and events are returned with their
+    extractor's name, so the sinks are only ever called in the main process.
+    """
+    events = parse_saved(log_file, LastRead(log_file=previous), [EXTRACTORS[name] for name in names])
+    return [(extractor.name, event) for extractor, event in events]
 
-        last_read = LastRead.load()
-        from_line = last_read.line_number
-        last_read.update(log_file=log_file.name, line_number=0)
 
-        return get_coordinates(log_entries[from_line:], log_date)
+# When each replacement `latest.log` was first seen, by inode.
+replaced_at = {}
 
 
-def read_from_latest(log_folder: Path) -> list[CoordinateEntry]:
-    """Read from the `last_read` line number in latest.log."""
-    with open(Path(log_folder).joinpath("latest.log"), "r") as f:
-        log_entries = f.read().splitlines()
+def read_from_latest(log_folder: Path, last_read: LastRead) -> Iterator[CoordinateEntry]:
+    """
+    Read from the `last_read` byte offset in latest.log.
 
-        last_read = LastRead.load()
-        from_line = last_read.line_number
-        last_read.update(line_number=len(log_entries))
+    Only complete lines are consumed; a line that is still being written is
+    left for the next poll. If `latest.log` was truncated (it shrank), reading
+    restarts from the beginning of the file.
+
+    When rolling over, log4j renames `latest.log`, creates a new one, and only
+    then compresses the old one. If `latest.log` was replaced (the inode
+    changed) but its archive was not read yet, the offset still belongs to the
+    old file, so nothing is read until the archive shows up, or `ARCHIVE_WAIT`
+    seconds have passed.
+    """
+    offset = last_read.offset
+
+    with open(Path(log_folder).joinpath("latest.log"), "rb") as f:
+        stat = os.fstat(f.fileno())
+        if last_read.inode not in (None, stat.st_ino):
+            if monotonic() - replaced_at.setdefault(stat.st_ino, monotonic()) < ARCHIVE_WAIT:
+                print("latest.log was rolled over, waiting for its archive.")
+                return
+            print(f"No archive of the previous latest.log after {ARCHIVE_WAIT}s, reading from the start.")
+            offset = 0
+        elif offset and stat.st_size < last_read.size:
+            print("latest.log was truncated, reading from the start.")
+            offset = 0
+        replaced_at.clear()
+
+        extractors = enabled_extractors()
+        reader = LineReader(f, offset, partial=False, prefilter=markers(extractors))
+        for coord in dispatch(extract(reader, date.today(), extractors)):
+            coord.checkpoint = replace(
+                last_read, offset=reader.offset, inode=stat.st_ino, size=reader.offset
+            )
+            yield coord
+        size = f.tell()
 
-        return get_coordinates(log_entries[from_line:], date.today())
+    last_read.update(offset=reader.offset, inode=stat.st_ino, size=size)
 
 
-def scrape_all(log_folder: Path):
+def scrape_all(log_folder: Path) -> tuple[list[CoordinateEntry], LastRead]:
     """Scrape all log files and in `latest.log`. This is for first-time running only."""
-    log_files = sorted(
-        Path(log_folder).joinpath(f)
-        for f in os.listdir(log_folder)
-        if f.endswith(".log.gz")
-    )  # God bless ISO-8601.
+    catalog = LogCatalog.load()
+    catalog.refresh(log_folder)
+    log_files = [Path(log_folder).joinpath(name) for name in catalog.after("")]
     coords = []
 
     # First, parse all of the saved log files.
-    LastRead.init()
-    for log_file in log_files:
-        coords += read_from_saved(log_file)
+    last_read = LastRead()
+    if BACKFILL_WORKERS > 1 and len(log_files) > 1:
+        print(f"Backfilling {len(log_files)} log files with {BACKFILL_WORKERS} workers.")
+        previous = [""] + [f.name for f in log_files[:-1]]
+        names = [extractor.name for extractor in enabled_extractors()]
+        with ProcessPoolExecutor(BACKFILL_WORKERS) as pool:
+            # `map` yields in submission order, so the results are merged
+            # chronologically and `last_read` only moves past a file once every
+            # file before it is done.
+            results = pool.map(_parse_saved_to_list, log_files, previous, repeat(names))
+            for log_file, events in zip(log_files, results):
+                coords += dispatch((EXTRACTORS[name], event) for name, event in events)
+                last_read.update(log_file=log_file.name)
+    else:
+        for log_file in log_files:
+            coords += read_from_saved(log_file, last_read)
 
     # Then, parse the current log file.
-    coords += read_from_latest(log_folder)
-    return coords
+    coords += read_from_latest(log_folder, last_read)
+    return coords, last_read
+
 
+def check_for_coords(log_folder: str | Path) -> tuple[list[CoordinateEntry], LastRead]:
+    """
+    Check the log folders for any new coordinate entries.
 
-def check_for_coords(log_folder: str | Path) -> list[CoordinateEntry]:
-    """Check the log folders for any new coordinate entries."""
+    Returns the entries found along with where reading stopped. Nothing is
+    saved: commit each entry's `checkpoint` as it is delivered, then commit the
+    returned `LastRead` once all of them are.
+    """
     log_folder = Path(log_folder)
-    log_files = sorted(f for f in os.listdir(log_folder) if f.endswith(".log.gz"))
     last_read = LastRead.load()
 
     # Nothing is read, this is the first run.
@@ -225,23 +586,24 @@ def check_for_coords(log_folder: str | Path) -> list[CoordinateEntry]:
         return scrape_all(log_folder)
 
     # Scrape log files that was just created.
+    catalog = LogCatalog.load()
+    catalog.refresh(log_folder, last_read.log_file)
     coords = []
-    if last_read.log_file != log_files[-1]:
+    if new_files := catalog.after(last_read.log_file):
         print("New log file(s) rolled over.")
-        new_index = log_files.index(last_read.log_file) + 1
-
-        for log_file in log_files[new_index:]:
-            coords += read_from_saved(log_folder / log_file)
+        for log_file in new_files:
+            coords += read_from_saved(log_folder / log_file, last_read)
 
     # Scrape from latest.log.
-    coords += read_from_latest(log_folder)
+    coords += read_from_latest(log_folder, last_read)
 
     if coords:
-        print(LastRead.load())
+        print(last_read)
         for coord in coords:
             print(coord)
-    return coords
+    return coords, last_read
 
 
 if __name__ == "__main__":
-    check_for_coords("logs")
+    _, last_read = check_for_coords("logs")
+    last_read.commit(force=True)
@@ -0,0 +1,124 @@
+"""
+Send embeds to a Discord webhook in batches.
+
+Discord accepts up to 10 embeds in a single webhook message, so queued embeds
+are packed together instead of sending one request per embed. Requests go
+through one keep-alive session, and the rate limit headers Discord returns are
+followed so that we wait before hitting a 429 instead of after.
+
+Only the webhook URL is needed, so this can be pointed at a local HTTP server
+standing in for Discord.
+"""
+
+import time
+from collections import deque
+from collections.abc import Callable
+
+import requests
+from discord import Embed
+
+from metrics import registry
+
+# Discord's limit on embeds per message.
+MAX_EMBEDS = 10
+
+REQUEST_SECONDS = registry.histogram("webhook_request_seconds", "Time per webhook request.")
+RATE_LIMITED = registry.counter("webhook_rate_limited_total", "Webhook requests answered with a 429.")
+FAILED = registry.counter("webhook_failed_total", "Webhook requests that errored or returned a 5xx.")
+
+
+class DeliveryError(Exception):
+    """Raised when a batch could not be delivered after retrying."""
+
+
+class DeliveryQueue:
+    def __init__(
+        self,
+        url: str,
+        max_pending: int = 100,
+        max_retries: int = 5,
+        timeout: float = 10,
+        session: requests.Session = None,
+    ):
+        self.url = url
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.pending = deque()
+        # When the current rate limit bucket resets, if it is used up.
+        self.blocked_until = 0.0
+
+    def put(self, embed: Embed | dict, on_sent: Callable[[], None] = None):
+        """
+        Queue an embed to be sent.
+
+        `on_sent` is called once the message containing the embed has been
+        delivered. If the queue is full, it is flushed first, so memory use
+        stays bounded no matter how many embeds are queued.
+        """
+        if len(self.pending) >= self.max_pending:
+            self.flush()
+        self.pending.append((embed, on_sent))
+
+    def flush(self):
+        """Send everything in the queue, up to `MAX_EMBEDS` per message."""
+        while self.pending:
+            batch = [self.pending[i] for i in range(min(MAX_EMBEDS, len(self.pending)))]
+            self._post([e.to_dict() if isinstance(e, Embed) else e for e, _ in batch])
+
+            for _ in batch:
+                _, on_sent = self.pending.popleft()
+                if on_sent:
+                    on_sent()
+
+    def _post(self, embeds: list[dict]):
+        """Send one message, waiting out rate limits and retrying failures."""
+        for attempt in range(self.max_retries + 1):
+            if (delay := self.blocked_until - time.monotonic()) > 0:
+                time.sleep(delay)
+
+            try:
+                with REQUEST_SECONDS.time():
+                    response = self.session.post(
+                        self.url, json={"embeds": embeds}, timeout=self.timeout
+                    )
+            except requests.RequestException as e:
+                print(f"Webhook request failed: {e}")
+                FAILED.inc()
+                time.sleep(2**attempt)
+                continue
+
+            self._track_rate_limit(response)
+
+            if response.status_code == 429:
+                retry_after = self._retry_after(response)
+                print(f"Rate limited, retrying in {retry_after:.2f}s.")
+                RATE_LIMITED.inc()
+                self.blocked_until = time.monotonic() + retry_after
+                continue
+            if response.status_code >= 500:
+                print(f"Webhook returned {response.status_code}, retrying.")
+                FAILED.inc()
+                time.sleep(2**attempt)
+                continue
+
+            response.raise_for_status()
+            return
+
+        raise DeliveryError(f"Could not deliver {len(embeds)} embed(s) after {self.max_retries} retries.")
+
+    def _track_rate_limit(self, response: requests.Response):
+        """Wait for the bucket to reset once Discord says it is used up."""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset_after = response.headers.get("X-RateLimit-Reset-After")
+        if remaining == "0" and reset_after:
+            self.blocked_until = time.monotonic() + float(reset_after)
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> float:
+        """Read how long to wait after a 429, from the body or the headers."""
+        try:
+            return float(response.json()["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return float(response.headers.get("Retry-After", 1))
@@ -0,0 +1,130 @@
+"""
+Extract events from server logs in a single pass.
+
+Each kind of event (coordinates in chat, players joining and leaving,
+advancements...) has an `Extractor`: a marker that every matching line
+contains, a precompiled pattern, and a function building the event from the
+match. All enabled extractors share one read of the logs, so a new kind of
+event costs no extra I/O: lines are only decoded if they contain one of the
+markers, and only matched against the patterns whose marker they contain.
+
+Extractors are registered by name in `EXTRACTORS`, and enabled with a sink
+that receives their events:
+
+    enable("sessions", JsonlSink("log_events.jsonl"))
+
+Events are sent to their sink as the logs are read. If the coordinates read
+alongside them fail to be delivered, the same lines are read again later, so a
+sink may see an event more than once.
+"""
+
+import json
+import re
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, time, timezone
+
+
+@dataclass
+class Extractor:
+    name: str
+    # A substring every matching line contains, checked before `pattern`.
+    marker: str
+    pattern: re.Pattern
+    # Builds the event from a match and the date of the log, or returns
+    # `None` if the line turns out not to be an event after all.
+    build: Callable[[re.Match, date], object]
+    sink: Callable[[object], None] = None
+    enabled: bool = False
+
+
+# All known extractors, by name.
+EXTRACTORS: dict[str, Extractor] = {}
+
+
+def register(extractor: Extractor) -> Extractor:
+    EXTRACTORS[extractor.name] = extractor
+    return extractor
+
+
+def enable(name: str, sink: Callable[[object], None] = None) -> Extractor:
+    """Enable a registered extractor, sending its events to `sink`."""
+    try:
+        extractor = EXTRACTORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown log event {name!r}, expected one of: {', '.join(EXTRACTORS)}") from None
+    extractor.sink = sink
+    extractor.enabled = True
+    return extractor
+
+
+def enabled_extractors() -> list[Extractor]:
+    return [extractor for extractor in EXTRACTORS.values() if extractor.enabled]
+
+
+def markers(extractors: Iterable[Extractor]) -> list[str]:
+    return [extractor.marker for extractor in extractors]
+
+
+def extract(lines: Iterable[str], log_date: date, extractors: list[Extractor]) -> Iterator[tuple[Extractor, object]]:
+    """Yield each event found in `lines`, along with the extractor that found it."""
+    checks = [(e.marker, e.pattern.match, e.build, e) for e in extractors]
+    for line in lines:
+        for marker, match, build, extractor in checks:
+            if marker in line and (m := match(line)) and (event := build(m, log_date)) is not None:
+                yield extractor, event
+
+
+def log_datetime(match: re.Match, log_date: date) -> datetime:
+    """The time of a log line, from the `time` group of its match."""
+    return datetime.combine(log_date, time.fromisoformat(match["time"]), timezone.utc)
+
+
+class JsonlSink:
+    """Append events to a JSON lines file, one object per event."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "a", buffering=1)
+
+    def __call__(self, event):
+        record = {"type": type(event).__name__, **asdict(event)}
+        self.file.write(json.dumps(record, default=str) + "\n")
+
+
+@dataclass(slots=True)
+class SessionEvent:
+    dt: datetime
+    username: str
+    joined: bool
+
+
+@dataclass(slots=True)
+class AdvancementEvent:
+    dt: datetime
+    username: str
+    advancement: str
+
+
+register(
+    Extractor(
+        "sessions",
+        " the game",
+        re.compile(
+            r"\[(?P<time>\d\d:\d\d:\d\d)\] \[Server thread/INFO\]: (?P<username>\w+) (?P<action>joined|left) the game$"
+        ),
+        lambda m, d: SessionEvent(log_datetime(m, d), m["username"], m["action"] == "joined"),
+    )
+)
+
+register(
+    Extractor(
+        "advancements",
+        " has ",
+        re.compile(
+            r"\[(?P<time>\d\d:\d\d:\d\d)\] \[Server thread/INFO\]: (?P<username>\w+) has "
+            r"(?:made the advancement|reached the goal|completed the challenge) \[(?P<advancement>.+)\]$"
+        ),
+        lambda m, d: AdvancementEvent(log_datetime(m, d), m["username"], m["advancement"]),
+    )
+)
@@ -0,0 +1,133 @@
+"""
+Wait for changes in the Minecraft log folder.
+
+On Linux, the folder is watched with inotify so that a write to `latest.log` or
+a new `.log.gz` archive wakes the scraper within milliseconds. Bursts of writes
+(for example, a busy chat) are debounced into a single wake-up.
+
+Where inotify is not available (other platforms, or the watch limit has been
+reached), this falls back to sleeping for the whole timeout, just like polling.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+from pathlib import Path
+
+# See inotify(7).
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_log_file(name: str) -> bool:
+    """Return whether a file name in the log folder is worth waking up for."""
+    return name == "latest.log" or name.endswith(".log.gz")
+
+
+class PollingWatcher:
+    """Fallback watcher that simply sleeps."""
+
+    async def wait(self, timeout: float) -> bool:
+        """Sleep for `timeout` seconds. Always returns `False`."""
+        await asyncio.sleep(timeout)
+        return False
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Watch the log folder for changes using inotify."""
+
+    def __init__(self, log_folder: str | Path, debounce: float = 0.1, max_delay: float = 0.5):
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(log_folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"Cannot watch {log_folder}")
+
+    def _drain(self) -> bool:
+        """Read all queued events. Returns whether any of them are relevant."""
+        relevant = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return relevant
+
+            pos = 0
+            while pos < len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size
+                name = data[pos : pos + length].rstrip(b"\0").decode(errors="replace")
+                pos += length
+                if mask & IN_Q_OVERFLOW or is_log_file(name):
+                    relevant = True
+
+    async def wait(self, timeout: float) -> bool:
+        """
+        Wait until a log file changes or `timeout` seconds have passed.
+
+        Once a change is seen, keep collecting events until there has been
+        `debounce` seconds of quiet, but never delay for more than `max_delay`.
+        Returns whether a change was seen.
+        """
+        loop = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        loop.add_reader(self.fd, readable.set)
+
+        async def wait_readable(timeout: float) -> bool:
+            try:
+                await asyncio.wait_for(readable.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+            readable.clear()
+            return True
+
+        try:
+            deadline = loop.time() + timeout
+            while True:
+                if not await wait_readable(deadline - loop.time()):
+                    return False
+                if self._drain():
+                    break
+
+            flush_by = loop.time() + self.max_delay
+            while (remaining := min(self.debounce, flush_by - loop.time())) > 0:
+                if not await wait_readable(remaining):
+                    break
+                self._drain()
+            return True
+        finally:
+            loop.remove_reader(self.fd)
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watch(log_folder: str | Path) -> InotifyWatcher | PollingWatcher:
+    """Watch the log folder with inotify if possible, otherwise fall back to polling."""
+    try:
+        watcher = InotifyWatcher(log_folder)
+        print("Watching the log folder for changes.")
+        return watcher
+    except (OSError, AttributeError, TypeError) as e:
+        # AttributeError: libc has no inotify (not Linux).
+        # TypeError: no libc was found at all.
+        print(f"Cannot watch the log folder ({e}), falling back to polling.")
+        return PollingWatcher()
@@ -0,0 +1,36 @@
+"""
+The metrics registry from `mcutils`, if it is available.
+
+The webhooks only need the `mcutils` folder from the repo root for tick
+health. Without it, metrics are recorded into a registry that keeps nothing.
+"""
+
+from contextlib import nullcontext
+
+try:
+    from mcutils.metrics import registry
+except ImportError:
+
+    class NoopMetric:
+        def inc(self, amount: float = 1):
+            pass
+
+        def set(self, value: float):
+            pass
+
+        def observe(self, value: float):
+            pass
+
+        def time(self):
+            return nullcontext()
+
+    class NoopRegistry:
+        def counter(self, name: str, help: str, **labels) -> NoopMetric:
+            return NoopMetric()
+
+        gauge = histogram = counter
+
+        def serve(self, port: int, host: str = "127.0.0.1"):
+            print("Metrics need the mcutils folder from the repo root; not serving them.")
+
+    registry = NoopRegistry()
@@ -1,42 +1,291 @@
+import asyncio
 import os
+import socket
 import sys
+import threading
 import time
+from collections import deque
+from collections.abc import Awaitable, Callable, Iterator
+from dataclasses import dataclass, field
+from datetime import date
+from functools import partial
 
 from discord import SyncWebhook
 
-from coords_scraper import check_for_coords
-from server_status import query_server
+# Shared modules live in mcutils/, in the repo root. Only tick health and
+# metrics need them.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from coord_store import CoordStore
+from coords_scraper import CoordinateEntry, LastRead, check_for_coords, get_coordinates
+from delivery import DeliveryQueue
+from log_events import JsonlSink, enable
+from log_watcher import watch
+from metrics import registry
+from server_status import ServerInfo, query_server
 
 POLLING_INTERVAL = int(os.getenv("POLLING_INTERVAL", 30))
+STATUS_INTERVAL = int(os.getenv("STATUS_INTERVAL") or POLLING_INTERVAL)
+COORDS_TIMEOUT = int(os.getenv("COORDS_TIMEOUT", 300))
+STATUS_TIMEOUT = int(os.getenv("STATUS_TIMEOUT", 20))
+STATUS_HEARTBEAT = int(os.getenv("STATUS_HEARTBEAT", 300))
+# Number of runs between reports of how long each pipeline takes.
+REPORT_EVERY = 20
 COORD_WEBHOOK_URL = os.environ["COORD_WEBHOOK_URL"]
 STATUS_WEBHOOK_URL = os.environ["STATUS_WEBHOOK_URL"]
 
 STATUS_MESSAGE_ID = int(os.getenv("STATUS_MESSAGE_ID") or 0)
+CONSOLE_SOCKET = os.getenv("CONSOLE_SOCKET")
+# Other events to extract from the logs while looking for coordinates, like
+# "sessions,advancements", and where to write them.
+LOG_EVENTS = os.getenv("LOG_EVENTS", "")
+LOG_EVENTS_FILE = os.getenv("LOG_EVENTS_FILE", "log_events.jsonl")
+# Also keep every coordinate in this SQLite database, if set.
+COORD_DB = os.getenv("COORD_DB")
+
+# Tick health monitoring, only if RCON is set up.
+RCON_PASSWORD = os.getenv("MC_RCON_PASSWORD")
+RCON_HOST = os.getenv("MC_HOST_ADDRESS", "localhost")
+RCON_PORT = int(os.getenv("MC_RCON_PORT") or 25575)
+TICK_INTERVAL = int(os.getenv("TICK_INTERVAL", 5))
+MSPT_THRESHOLD = float(os.getenv("MSPT_THRESHOLD", 50))
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL") or STATUS_WEBHOOK_URL
+
+# Serve Prometheus metrics on this port, if set.
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+COORDS_FOUND = registry.counter("coords_found_total", "Coordinate entries found in the logs.")
+# Time spent finding coordinates, without sending them.
+PARSE_SECONDS = {
+    source: registry.histogram("coords_parse_seconds", "Time spent reading coordinates.", source=source)
+    for source in ("logs", "console")
+}
+
+# Coordinates already sent from the console stream, so that they are skipped
+# when they are read again from the log files.
+streamed = deque(maxlen=1000)
+streamed_lock = threading.Lock()
+
+
+def coord_key(coord: CoordinateEntry) -> tuple:
+    return coord.dt, coord.username, coord.x, coord.y, coord.z, coord.comment
+
+
+def was_streamed(coord: CoordinateEntry) -> bool:
+    """Check whether a coordinate entry was already sent from the console stream."""
+    with streamed_lock:
+        try:
+            streamed.remove(coord_key(coord))
+            return True
+        except ValueError:
+            return False
+
+
+def read_console(socket_path: str) -> Iterator[str]:
+    """Read lines from the console stream of a server started by `start-server.py`."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        with s.makefile("r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+
+def stream_coords(socket_path: str):
+    """
+    Send coordinates as soon as they show up in the server console.
+
+    The log files are still read as usual and remain the durable record; this
+    only gets the coordinates to Discord sooner. Reconnects whenever the stream
+    goes away (for example, while the server restarts).
+    """
+    delivery = DeliveryQueue(COORD_WEBHOOK_URL)
+    while True:
+        try:
+            print(f"Reading the console stream at {socket_path}")
+            for line in read_console(socket_path):
+                # Timed per line, so that waiting on the console is not counted.
+                with PARSE_SECONDS["console"].time():
+                    coords = list(get_coordinates((line,), date.today()))
+                for coord in coords:
+                    stream_coord(delivery, coord)
+        except Exception as e:
+            print(f"Console stream unavailable: {e}")
+        time.sleep(POLLING_INTERVAL)
+
+
+def stream_coord(delivery: DeliveryQueue, coord: CoordinateEntry):
+    """Send a coordinate entry from the console stream."""
+    # Recorded before posting, so that the log files being read in the
+    # meantime cannot send it a second time.
+    key = coord_key(coord)
+    with streamed_lock:
+        streamed.append(key)
+    try:
+        delivery.put(coord.to_embed())
+        delivery.flush()
+    except Exception:
+        # Left for the log files to send.
+        delivery.pending.clear()
+        with streamed_lock:
+            if key in streamed:
+                streamed.remove(key)
+        raise
+
+
+coord_delivery = DeliveryQueue(COORD_WEBHOOK_URL)
+coord_store = CoordStore(COORD_DB) if COORD_DB else None
 
 
 def send_coords(log_folder: str):
-    coords = check_for_coords(log_folder)
-    webhook = SyncWebhook.from_url(COORD_WEBHOOK_URL)
-    for coord in coords:
-        embed = coord.to_embed()
-        webhook.send(embed=embed)
+    with PARSE_SECONDS["logs"].time():
+        coords, last_read = check_for_coords(log_folder)
+    COORDS_FOUND.inc(len(coords))
+    # Stored before sending: if sending fails, the same entries are read again
+    # and storing them twice changes nothing.
+    if coord_store is not None:
+        coord_store.add_many(coords)
+    try:
+        for coord in coords:
+            if was_streamed(coord):
+                coord.checkpoint.commit()
+            else:
+                coord_delivery.put(coord.to_embed(), on_sent=coord.checkpoint.commit)
+        coord_delivery.flush()
+    except Exception:
+        # Anything not delivered will be read again from the last checkpoint.
+        coord_delivery.pending.clear()
+        raise
+    last_read.commit()
+
+
+class StatusMessage:
+    """
+    The message showing the server status, edited in place.
+
+    The message is only fetched once, and only edited when the server status
+    changed or `STATUS_HEARTBEAT` seconds have passed (to refresh the uptime
+    and timestamp), instead of two requests every poll.
+    """
+
+    def __init__(self, message_id: int):
+        self.message_id = message_id
+        self.message = None
+        self.fingerprint = None
+        self.edited_at = 0.0
+
+    def update(self, server: ServerInfo):
+        fingerprint = server.fingerprint()
+        if fingerprint == self.fingerprint and time.monotonic() - self.edited_at < STATUS_HEARTBEAT:
+            return
+
+        try:
+            if self.message is None:
+                webhook = SyncWebhook.from_url(STATUS_WEBHOOK_URL)
+                self.message = webhook.fetch_message(self.message_id)
+            self.message.edit(embed=server.to_embed())
+        except Exception:
+            # The message may be gone; fetch it again next time.
+            self.message = None
+            raise
+
+        self.fingerprint = fingerprint
+        self.edited_at = time.monotonic()
+
+
+status_message = StatusMessage(STATUS_MESSAGE_ID)
 
 
 def update_server_status(message_id: int):
     server = query_server()
-    webhook = SyncWebhook.from_url(STATUS_WEBHOOK_URL)
-    embed = server.to_embed()
 
     # First-time setup.
     if not message_id:
-        message = webhook.send(embed=embed, wait=True)
+        webhook = SyncWebhook.from_url(STATUS_WEBHOOK_URL)
+        message = webhook.send(embed=server.to_embed(), wait=True)
         raise UserWarning(
             f"FIRST-TIME SETUP: The message has been sent with the ID {message.id}. "
             f"Set the environment variable `STATUS_MESSAGE_ID` to this value and re-run this script."
         )
 
-    message = webhook.fetch_message(message_id)
-    message.edit(embed=embed)
+    status_message.update(server)
+
+
+@dataclass
+class Pipeline:
+    """
+    A job that runs on its own interval, isolated from the other pipelines.
+
+    `func` is blocking, so it runs in a worker thread. If a run takes longer
+    than `timeout`, it is reported and left to finish in the background; no new
+    run starts until it does. `wait` is awaited between runs, and may return
+    early (for example, when the logs change).
+    """
+
+    name: str
+    func: Callable[[], None]
+    interval: float
+    timeout: float
+    wait: Callable[[float], Awaitable] = asyncio.sleep
+    latencies: list[float] = field(default_factory=list)
+
+    async def run(self):
+        running = None
+        while True:
+            start = time.monotonic()
+            if running is None or running.done():
+                running = asyncio.ensure_future(asyncio.to_thread(self.func))
+            else:
+                print(f"[{self.name}] Previous run is still going.")
+
+            try:
+                await asyncio.wait_for(asyncio.shield(running), self.timeout)
+                self.report(time.monotonic() - start)
+            except asyncio.TimeoutError:
+                print(f"[{self.name}] Timed out after {self.timeout}s.")
+            except Exception as e:
+                print(f"[{self.name}] Something went wrong: {e}")
+
+            await self.wait(max(0, self.interval - (time.monotonic() - start)))
+
+    def report(self, latency: float):
+        """Keep track of how long runs take, and print a summary every so often."""
+        registry.histogram("pipeline_run_seconds", "Time per pipeline run.", pipeline=self.name).observe(latency)
+        self.latencies.append(latency)
+        if len(self.latencies) < REPORT_EVERY:
+            return
+
+        average = sum(self.latencies) / len(self.latencies)
+        print(
+            f"[{self.name}] Last {len(self.latencies)} runs took "
+            f"{average * 1000:.0f} ms on average, {max(self.latencies) * 1000:.0f} ms at most."
+        )
+        self.latencies.clear()
+
+
+async def main(log_folder: str):
+    # Coordinates are scraped as soon as the logs change, but the server status
+    # is only updated once per interval. Neither waits on the other.
+    watcher = watch(log_folder)
+    pipelines = [
+        Pipeline(
+            "coords", partial(send_coords, log_folder), POLLING_INTERVAL, COORDS_TIMEOUT, wait=watcher.wait
+        ),
+        Pipeline("status", partial(update_server_status, STATUS_MESSAGE_ID), STATUS_INTERVAL, STATUS_TIMEOUT),
+    ]
+    if RCON_PASSWORD:
+        from mcutils.rcon import RconClient
+        from tick_monitor import TickMonitor
+
+        rcon = RconClient(RCON_HOST, RCON_PORT, RCON_PASSWORD, timeout=TICK_INTERVAL)
+        monitor = TickMonitor(rcon, DeliveryQueue(ALERT_WEBHOOK_URL), threshold=MSPT_THRESHOLD)
+        pipelines.append(Pipeline("ticks", monitor.sample, TICK_INTERVAL, TICK_INTERVAL * 2))
+    if CONSOLE_SOCKET:
+        threading.Thread(target=stream_coords, args=(CONSOLE_SOCKET,), daemon=True).start()
+    if METRICS_PORT:
+        registry.serve(METRICS_PORT)
+
+    try:
+        await asyncio.gather(*(p.run() for p in pipelines))
+    finally:
+        watcher.close()
 
 
 if __name__ == "__main__":
@@ -45,11 +294,16 @@ if __name__ == "__main__":
 
     print(f"Polling interval: {POLLING_INTERVAL}")
 
-    while True:
-        try:
-            send_coords(sys.argv[1])
-            update_server_status(STATUS_MESSAGE_ID)
+    if LOG_EVENTS:
+        sink = JsonlSink(LOG_EVENTS_FILE)
+        for name in LOG_EVENTS.split(","):
+            enable(name.strip(), sink)
 
-            time.sleep(POLLING_INTERVAL)
-        except Exception as e:
-            print(f"Something went wrong: {e}")
+    # Sends the status message and stops, asking for STATUS_MESSAGE_ID.
+    if not STATUS_MESSAGE_ID:
+        update_server_status(STATUS_MESSAGE_ID)
+
+    try:
+        asyncio.run(main(sys.argv[1]))
+    finally:
+        LastRead.flush()
@@ -1,14 +1,34 @@
+import asyncio
+import hashlib
 import os
-from dataclasses import dataclass
+import time
+from dataclasses import astuple, dataclass, replace
 from datetime import datetime
 
 import discord
 from discord import Embed
 from mcstatus import JavaServer
 from mcstatus import motd
+from mcstatus.address import Address
 from mcstatus.motd.components import ParsedMotdComponent
+from mcstatus.protocol.connection import TCPAsyncSocketConnection
+
+from metrics import registry
 
 SERVER_ADDRESS = os.environ["SERVER_ADDRESS"]
+# How long to reuse the resolved server address, in seconds.
+RESOLVE_TTL = int(os.getenv("RESOLVE_TTL", 300))
+# How long the query and status probes may each take, in seconds.
+PROBE_TIMEOUT = float(os.getenv("PROBE_TIMEOUT", 5))
+
+PROBE_SECONDS = {
+    probe: registry.histogram("server_probe_seconds", "Time per server probe.", probe=probe)
+    for probe in ("query", "status")
+}
+PROBE_FAILED = {
+    probe: registry.counter("server_probe_failed_total", "Server probes that failed or timed out.", probe=probe)
+    for probe in ("query", "status")
+}
 
 
 @dataclass
@@ -23,6 +43,13 @@ class ServerInfo:
     max_players: int = None
     version: str = None
     motd: str = None
+    query_latency: float = None
+    status_latency: float = None
+
+    def fingerprint(self) -> str:
+        """Hash the status shown in the embed, leaving out the uptime, latency and timestamp."""
+        status = replace(self, query_latency=None, status_latency=None)
+        return hashlib.sha1(repr(astuple(status)).encode()).hexdigest()
 
     def get_uptime(self) -> float:
         return self.successful_queries / self.total_queries if self.total_queries else 0
@@ -35,7 +62,10 @@ class ServerInfo:
 
         embed.title = "Server status"
         embed.add_field(name="Address", value=f"```{self.address}```", inline=False)
-        embed.set_footer(text=f"{self.get_uptime():.2%} uptime")
+        footer = f"{self.get_uptime():.2%} uptime"
+        if self.status_latency is not None:
+            footer += f" · {self.status_latency:.0f} ms"
+        embed.set_footer(text=footer)
         embed.timestamp = datetime.now()
 
         if not self.is_online:
@@ -90,26 +120,97 @@ def to_markdown(parsed: list[ParsedMotdComponent]) -> str:
     return "".join(md_text)
 
 
+class ResolvedServer(JavaServer):
+    """
+    A server reached at an IP address that was already looked up.
+
+    The handshake of the status ping still carries the host name, like a
+    client connecting to it would send, since proxies and virtual hosts route
+    on it. This relies on private methods of mcstatus, which is pinned in the
+    Pipfile for that reason.
+    """
+
+    def __init__(self, host: str, port: int, ip: str, timeout: float = 3):
+        super().__init__(host, port, timeout=timeout)
+        self.ip_address = Address(ip, port)
+
+    async def async_status(self, **kwargs):
+        async with TCPAsyncSocketConnection(self.ip_address, self.timeout) as connection:
+            return await self._retry_async_status(connection, **kwargs)
+
+    async def async_query(self):
+        return await self._retry_async_query(self.ip_address)
+
+
+resolved_server = None
+resolved_at = 0.0
+
+
+def resolve_server() -> JavaServer:
+    """Look up the server address (including SRV records), reusing it for `RESOLVE_TTL` seconds."""
+    global resolved_server, resolved_at
+    if resolved_server is None or time.monotonic() - resolved_at > RESOLVE_TTL:
+        server = JavaServer.lookup(SERVER_ADDRESS, timeout=PROBE_TIMEOUT)
+        ip = server.address.resolve_ip()
+        host = Address.parse_address(SERVER_ADDRESS, default_port=server.address.port).host
+        resolved_server = ResolvedServer(host, server.address.port, str(ip), timeout=PROBE_TIMEOUT)
+        resolved_at = time.monotonic()
+    return resolved_server
+
+
+async def probe(name: str, coro):
+    """Await a probe under `PROBE_TIMEOUT`. Returns the result and latency (ms), or `None`s on failure."""
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(coro, PROBE_TIMEOUT)
+    except Exception:
+        PROBE_FAILED[name].inc()
+        return None, None
+    elapsed = time.perf_counter() - start
+    PROBE_SECONDS[name].observe(elapsed)
+    return result, elapsed * 1000
+
+
+async def probe_server(server: JavaServer):
+    """Run the UDP query and the TCP status ping at the same time."""
+    return await asyncio.gather(probe("query", server.async_query()), probe("status", server.async_status()))
+
+
 def query_server() -> ServerInfo:
-    server = JavaServer.lookup(SERVER_ADDRESS)
+    global resolved_server
     ServerInfo.total_queries += 1
 
     try:
-        query = server.query()
-        status = server.status()
-        ServerInfo.successful_queries += 1
-
-        return ServerInfo(
-            is_online=True,
-            players=query.players.names,
-            players_online=query.players.online,
-            max_players=query.players.max,
-            version=status.version.name,
-            motd=to_markdown(status.motd.parsed),
-        )
+        server = resolve_server()
     except Exception:
         return ServerInfo(is_online=False)
 
+    (query, query_latency), (status, status_latency) = asyncio.run(probe_server(server))
+    if status is None:
+        # Look up the address again next time, in case it changed.
+        resolved_server = None
+        return ServerInfo(is_online=False)
+
+    ServerInfo.successful_queries += 1
+
+    # The query may be disabled on the server, in which case only the sample
+    # of players from the status ping is available.
+    if query is not None:
+        players = query.players.names
+    else:
+        players = [player.name for player in status.players.sample or []]
+
+    return ServerInfo(
+        is_online=True,
+        players=players,
+        players_online=status.players.online,
+        max_players=status.players.max,
+        version=status.version.name,
+        motd=to_markdown(status.motd.parsed),
+        query_latency=query_latency,
+        status_latency=status_latency,
+    )
+
 
 if __name__ == "__main__":
-    query_server()
+    print(query_server())
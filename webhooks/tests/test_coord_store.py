@@ -0,0 +1,29 @@
+import os
+import sys
+
+# The store lives one folder up.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from coord_store import CoordStore
+from coords_scraper import CoordinateEntry
+
+
+def store_with(*points: tuple[float, float]) -> CoordStore:
+    store = CoordStore(":memory:")
+    store.add_many(CoordinateEntry(x, 64, z, f"{x} {z}", "Steve") for x, z in points)
+    return store
+
+
+def test_in_box_includes_entries_on_the_edges():
+    # Neither is exact as a 32-bit float, which is what the R-tree stores.
+    store = store_with((0.1, 0.3), (16777217, 5))
+    assert [c.comment for c in store.in_box(0, 0, 0.1, 0.3)] == ["0.1 0.3"]
+    assert [c.comment for c in store.in_box(0.1, 0.3, 1, 1)] == ["0.1 0.3"]
+    assert [c.comment for c in store.in_box(16777217, 0, 16777300, 10)] == ["16777217 5"]
+    assert [c.comment for c in store.in_box(16777000, 0, 16777217, 10)] == ["16777217 5"]
+
+
+def test_in_box_uses_exact_bounds():
+    store = store_with((0.1, 0.3), (16777217, 5))
+    assert store.in_box(0, 0, 0.1, 0.29999999) == []
+    assert store.in_box(16777218, 0, 16777300, 10) == []
+    assert store.in_box(16777000, 0, 16777216, 10) == []
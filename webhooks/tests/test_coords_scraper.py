@@ -0,0 +1,123 @@
+import gzip
+import os
+import shutil
+import sys
+
+import pytest
+
+# The scraper lives one folder up.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import coords_scraper
+from coords_scraper import LastRead, LogCatalog, check_for_coords
+
+
+def chat(username: str, message: str) -> str:
+    return f"[12:00:00] [Server thread/INFO]: <{username}> {message}\n"
+
+
+@pytest.fixture
+def logs(tmp_path, monkeypatch):
+    """An empty log folder, with `last_read.json` and `log_catalog.json` kept next to it."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(LastRead, "committed", None)
+    monkeypatch.setattr(LastRead, "committed_at", 0.0)
+    monkeypatch.setattr(LastRead, "pending", None)
+    monkeypatch.setattr(LogCatalog, "loaded", None)
+    coords_scraper.replaced_at.clear()
+    (tmp_path / "logs").mkdir()
+    return tmp_path / "logs"
+
+
+def poll(logs) -> list[str]:
+    coords, last_read = check_for_coords(logs)
+    last_read.commit(force=True)
+    return [coord.comment for coord in coords]
+
+
+def append(path, *lines: str):
+    with open(path, "a") as f:
+        f.writelines(lines)
+
+
+def test_reads_only_new_lines(logs):
+    append(logs / "latest.log", chat("Steve", "base 100 64 200"))
+    assert poll(logs) == ["base"]
+    append(logs / "latest.log", chat("Alex", "farm 10 -20"), "[12:00:01] [Server thread/INFO]: Done\n")
+    assert poll(logs) == ["farm"]
+    assert poll(logs) == []
+
+
+def test_rollover_waits_for_the_archive(logs):
+    append(logs / "latest.log", chat("Steve", "base 100 64 200"))
+    assert poll(logs) == ["base"]
+    append(logs / "latest.log", chat("Steve", "portal 1 2 3"))
+
+    # log4j renames latest.log and starts a new one...
+    os.rename(logs / "latest.log", logs / "2024-05-01-1.log")
+    append(logs / "latest.log", chat("Alex", "farm 10 -20"))
+    committed = LastRead.load()
+    # ... so a poll before the old file is compressed must not read either file.
+    assert poll(logs) == []
+    assert LastRead.load() == committed
+
+    # ... then compresses the old one.
+    with open(logs / "2024-05-01-1.log", "rb") as src, gzip.open(logs / "2024-05-01-1.log.gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(logs / "2024-05-01-1.log")
+    assert poll(logs) == ["portal", "farm"]
+    assert poll(logs) == []
+
+
+def test_rollover_without_archive(logs, monkeypatch):
+    append(logs / "latest.log", chat("Steve", "base 100 64 200"))
+    assert poll(logs) == ["base"]
+    # Moved away rather than deleted, so that the new file gets another inode.
+    os.rename(logs / "latest.log", logs / "moved.log")
+    append(logs / "latest.log", chat("Alex", "farm 10 -20"))
+    assert poll(logs) == []
+
+    monkeypatch.setattr(coords_scraper, "ARCHIVE_WAIT", 0)
+    assert poll(logs) == ["farm"]
+    assert poll(logs) == []
+
+
+def test_archive_is_read_once_compressed(logs):
+    append(logs / "latest.log", chat("Steve", "base 100 64 200"))
+    assert poll(logs) == ["base"]
+    append(logs / "latest.log", chat("Steve", "portal 1 2 3"))
+    os.rename(logs / "latest.log", logs / "2024-05-01-1.log")
+    append(logs / "latest.log", chat("Alex", "farm 10 -20"))
+
+    # The archive shows up while log4j is still writing it.
+    with open(logs / "2024-05-01-1.log", "rb") as f:
+        data = gzip.compress(f.read())
+    with open(logs / "2024-05-01-1.log.gz", "wb") as f:
+        f.write(data[: len(data) // 2])
+    assert poll(logs) == []
+    assert "2024-05-01-1.log.gz" not in LogCatalog.load().archives
+
+    with open(logs / "2024-05-01-1.log.gz", "wb") as f:
+        f.write(data)
+    os.remove(logs / "2024-05-01-1.log")
+    assert poll(logs) == ["portal", "farm"]
+    assert poll(logs) == []
+
+
+def test_truncated_archive_is_not_marked_as_read(logs):
+    append(logs / "latest.log", chat("Steve", "base 100 64 200"))
+    assert poll(logs) == ["base"]
+    append(logs / "latest.log", chat("Steve", "portal 1 2 3"))
+    os.rename(logs / "latest.log", logs / "moved.log")
+    append(logs / "latest.log", chat("Alex", "farm 10 -20"))
+    with open(logs / "moved.log", "rb") as f:
+        data = gzip.compress(f.read())
+    with open(logs / "2024-05-01-1.log.gz", "wb") as f:
+        f.write(data[:-4])
+
+    with pytest.raises(EOFError):
+        poll(logs)
+    assert LastRead.load().log_file == ""
+
+    with open(logs / "2024-05-01-1.log.gz", "wb") as f:
+        f.write(data)
+    assert poll(logs) == ["portal", "farm"]
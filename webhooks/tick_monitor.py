@@ -0,0 +1,126 @@
+"""
+Monitor the server's tick health over RCON.
+
+Every few seconds, the average time per tick (MSPT) is sampled and stored in a
+fixed-size ring buffer. Every minute or so, the recent samples are rolled up
+(average, 95th percentile and maximum) and appended to `tick_rollups.jsonl`,
+which survives restarts.
+
+If ticks stay slower than the threshold for several samples in a row, an alert
+is posted to Discord, and another once the server has recovered.
+"""
+
+import json
+from array import array
+from datetime import datetime, timezone
+
+import discord
+from discord import Embed
+
+from delivery import DeliveryQueue
+from mcutils.rcon import RconClient
+from mcutils.ticks import query_mspt
+
+
+class TickRing:
+    """A fixed-size ring buffer of MSPT samples, kept in a flat array."""
+
+    def __init__(self, size: int):
+        self.values = array("f", bytes(4 * size))
+        self.size = size
+        self.next = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, mspt: float):
+        self.values[self.next] = mspt
+        self.next = (self.next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def last(self, n: int) -> list[float]:
+        """Return the last `n` values, oldest first."""
+        n = min(n, self.count)
+        return [self.values[(self.next - n + i) % self.size] for i in range(n)]
+
+
+def rollup(values: list[float]) -> dict:
+    """Summarize a list of MSPT samples."""
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "avg": sum(ordered) / len(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+class TickMonitor:
+    def __init__(
+        self,
+        rcon: RconClient,
+        alerts: DeliveryQueue,
+        threshold: float = 50.0,
+        alert_samples: int = 6,
+        rollup_samples: int = 12,
+        size: int = 720,
+        rollup_file: str = "tick_rollups.jsonl",
+    ):
+        self.rcon = rcon
+        self.alerts = alerts
+        self.threshold = threshold
+        self.alert_samples = alert_samples
+        self.rollup_samples = rollup_samples
+        self.rollup_file = rollup_file
+        self.ring = TickRing(size)
+        self.since_rollup = 0
+        self.alerting = False
+
+    def sample(self):
+        """Take one sample, then roll up and alert as needed."""
+        mspt = query_mspt(self.rcon)
+        if mspt is None:
+            return
+
+        self.ring.append(mspt)
+        self.since_rollup += 1
+        if self.since_rollup >= self.rollup_samples:
+            self.write_rollup()
+        self.check_alert()
+
+    def write_rollup(self):
+        summary = rollup(self.ring.last(self.since_rollup))
+        summary["time"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with open(self.rollup_file, "a") as f:
+            f.write(json.dumps(summary) + "\n")
+        self.since_rollup = 0
+
+    def check_alert(self):
+        """Alert once MSPT stays above the threshold, and again once it recovers."""
+        recent = self.ring.last(self.alert_samples)
+        if len(recent) < self.alert_samples:
+            return
+
+        if not self.alerting:
+            lagging = all(mspt > self.threshold for mspt in recent)
+        else:
+            lagging = not all(mspt <= self.threshold for mspt in recent)
+        if lagging == self.alerting:
+            return
+        self.alerting = lagging
+
+        average = sum(recent) / len(recent)
+        if lagging:
+            embed = Embed(color=discord.Color.red(), title="Server is lagging")
+            embed.description = (
+                f"Ticks have taken {average:.1f} ms on average over the last {len(recent)} samples "
+                f"(over the {self.threshold:.0f} ms threshold)."
+            )
+        else:
+            embed = Embed(color=discord.Color.green(), title="Server has recovered")
+            embed.description = f"Ticks are back to {average:.1f} ms on average."
+        embed.timestamp = datetime.now(timezone.utc)
+
+        self.alerts.put(embed)
+        self.alerts.flush()